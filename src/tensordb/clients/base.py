@@ -1,6 +1,18 @@
 import abc
+import contextlib
+import functools
+import multiprocessing
+import threading
+import time
 from collections.abc import Callable
-from typing import Any, Literal, Union
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import Any, Literal, Optional, Union
 
 import dask
 import dask.array as da
@@ -24,6 +36,13 @@ from tensordb.utils.tools import extract_paths_from_formula, groupby_chunks
 
 class BaseTensorClient(Algorithms):
     internal_actions = ["store", "update", "append", "upsert", "drop"]
+    dag_runs_path = "_dag_runs"
+    track_data_versions = False
+
+    @property
+    def _records_write_versions(self) -> bool:
+        # The modification_date or the data_version of the metadata change on every write
+        return self.track_data_versions
 
     def add_custom_data(self, path, new_data: dict):
         pass
@@ -94,6 +113,21 @@ class BaseTensorClient(Algorithms):
             e.args = (f"Tensor path: {params['path']}", *e.args)
             raise e
 
+    @staticmethod
+    def _exec_with_report(
+        func: Callable,
+        params,
+        *prev_tasks,
+    ) -> dict[str, Any]:
+        report = {"start": time.time()}
+        try:
+            report["result"] = BaseTensorClient._exec_on_dask(func, params)
+        except Exception as e:
+            report["error"] = e
+        report["end"] = time.time()
+        report["duration"] = report["end"] - report["start"]
+        return report
+
     @staticmethod
     def exec_on_parallel(
         method: Callable,
@@ -101,7 +135,9 @@ class BaseTensorClient(Algorithms):
         max_parallelization: int = None,
         client: Client = None,
         compute_kwargs: dict[str, Any] = None,
-    ):
+        executor: Literal["dask", "thread", "process"] = "dask",
+        raise_errors: bool = True,
+    ) -> dict[str, dict[str, Any]]:
         """
         This method was designed to execute multiple methods of the client on parallel
 
@@ -124,8 +160,26 @@ class BaseTensorClient(Algorithms):
 
         compute_kwargs: Dict[str, Any], default None
             Parameters of the dask.compute or client.compute
+
+        executor: Literal["dask", "thread", "process"], default "dask"
+            The "dask" executor computes the calls in chunks of max_parallelization tensors using
+            dask delayed, waiting for every chunk before starting the next one.
+            The "thread" and "process" executors use a pool of max_parallelization workers,
+            which starts a new call as soon as another finishes, the process pool is useful for the
+            transformations that hold the GIL but the method and its kwargs must be picklable.
+
+        raise_errors: bool, default True
+            Raise the first error after the running calls finish, no new calls are started after an error.
+            If False the errors are only returned on the report.
+
+        Returns
+        -------
+        A dict with the report of every path, it contains the "result" or the "error" of the call and
+        its "start", "end" and "duration" in seconds.
         """
         paths = list(paths_kwargs.keys())
+        if not paths:
+            return {}
 
         max_parallelization = (
             np.inf if max_parallelization is None else max_parallelization
@@ -134,17 +188,59 @@ class BaseTensorClient(Algorithms):
         compute_kwargs = compute_kwargs or {}
         client = dask if client is None else client
 
-        for sub_paths in mit.chunked(paths, max_parallelization):
-            logger.info(f"Processing the following tensors: {sub_paths}")
-            client.compute(
-                [
-                    dask.delayed(BaseTensorClient._exec_on_dask)(
-                        func=method, params={"path": path, **paths_kwargs[path]}
-                    )
-                    for path in sub_paths
-                ],
-                **compute_kwargs,
-            )
+        reports = {}
+        if executor == "dask":
+            for sub_paths in mit.chunked(paths, max_parallelization):
+                logger.info(f"Processing the following tensors: {sub_paths}")
+                sub_reports = client.compute(
+                    [
+                        dask.delayed(BaseTensorClient._exec_with_report)(
+                            func=method, params={"path": path, **paths_kwargs[path]}
+                        )
+                        for path in sub_paths
+                    ],
+                    **compute_kwargs,
+                )
+                if client is dask:
+                    sub_reports = sub_reports[0]
+                else:
+                    sub_reports = client.gather(sub_reports)
+                reports.update(zip(sub_paths, sub_reports, strict=True))
+                if raise_errors and any("error" in reports[path] for path in sub_paths):
+                    break
+        else:
+            if executor == "thread":
+                pool = ThreadPoolExecutor(max_parallelization)
+            else:
+                # Forking a process that has threads running can deadlock the children
+                pool = ProcessPoolExecutor(
+                    max_parallelization, mp_context=multiprocessing.get_context("spawn")
+                )
+            with pool:
+                logger.info(f"Processing the following tensors: {paths}")
+                futures = {
+                    pool.submit(
+                        BaseTensorClient._exec_with_report,
+                        method,
+                        {"path": path, **paths_kwargs[path]},
+                    ): path
+                    for path in paths
+                }
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    reports[futures[future]] = future.result()
+                    if raise_errors and "error" in reports[futures[future]]:
+                        for pending in futures:
+                            pending.cancel()
+
+        for path, report in reports.items():
+            if "error" in report:
+                logger.error(f"The tensor {path} failed: {report['error']}")
+                if raise_errors:
+                    raise report["error"]
+
+        return reports
 
     def exec_on_dag_order(
         self,
@@ -157,11 +253,16 @@ class BaseTensorClient(Algorithms):
         only_on_groups: set = None,
         check_dependencies: bool = True,
         omit_first_n_levels: int = 0,
-    ):
+        scheduler: Literal["levels", "streaming"] = "levels",
+        run_id: str = None,
+        continue_on_error: bool = False,
+        only_outdated: bool = False,
+    ) -> dict[str, Any]:
         """
         This method was designed to execute multiple methods of the client on parallel and following the dag
         order, this is useful for update/store multiple tensors that have dependencies between them in a fast way.
-        Internally calls the :meth:`BaseTensorClient.exec_on_parallel` for every level of the created DAG
+        Internally calls the :meth:`BaseTensorClient.exec_on_parallel` for every level of the created DAG,
+        or uses :meth:`BaseTensorClient.exec_on_streaming_dag` if the scheduler is streaming
 
         Parameters
         ----------
@@ -197,7 +298,41 @@ class BaseTensorClient(Algorithms):
             so only one tensor or a limited number of them can be executed at the same time to avoid overloading
             the resources.
 
+        scheduler: Literal["levels", "streaming"], default "levels"
+            The "levels" scheduler executes the DAG level by level waiting for all the tensors of the level
+            (and of every chunk of the groups) before continuing. The "streaming" scheduler starts every
+            tensor as soon as its dependencies are done, only the max_parallelization of the
+            parallelization_kwargs is used in this case.
+
+        run_id: str, default None
+            Identifier of the run, the status of every executed tensor is persisted using
+            :meth:`BaseTensorClient.add_custom_data` with the modification_date and data_version of the
+            metadata of the tensor and of its dependencies. Executing again the same run_id skips the tensors
+            that were done if neither they nor their dependencies were modified since then, read
+            :meth:`BaseTensorClient.get_dag_run_state`. None means that the progress is not persisted.
+            It requires a client that records the writes on the metadata of the tensors, so a TensorClient
+            without the track_data_versions option raises a ValueError.
+
+        continue_on_error: bool, default False
+            If True, a failed tensor only avoids the execution of the tensors that depend on it
+            and the errors are returned on the report instead of being raised.
+
+        only_outdated: bool, default False
+            Before executing the method on a tensor check if it is outdated using
+            :meth:`BaseTensorClient.is_outdated`, the tensors that are up to date are not executed.
+            The check is done once the dependencies of the tensor were executed, so a tensor is only
+            executed if the data of its dependencies changed.
+
+        Returns
+        -------
+        The report of :meth:`BaseTensorClient.exec_on_streaming_dag` with the tensors "skipped" because
+        they were already done on the run.
         """
+        if run_id is not None and not self._records_write_versions:
+            raise ValueError(
+                "The run_id requires a client that records the writes on the metadata of the tensors, "
+                "enable the track_data_versions option"
+            )
         kwargs_groups = kwargs_groups or {}
         parallelization_kwargs = parallelization_kwargs or {}
         max_parallelization_per_group = max_parallelization_per_group or {}
@@ -216,11 +351,11 @@ class BaseTensorClient(Algorithms):
                     tensors, self.get_all_tensors_definition()
                 )
 
+        levels = []
         for i, level in enumerate(dag.get_tensor_dag(tensors, check_dependencies)):
             if i < omit_first_n_levels:
                 continue
 
-            logger.info(f"Executing the {i} level of the DAG")
             # Filter the tensors base on the omit parameter
             level = [
                 tensor for tensor in level if method.__name__ not in tensor.dag.omit_on
@@ -231,20 +366,380 @@ class BaseTensorClient(Algorithms):
                     tensor for tensor in level if tensor.dag.group in only_on_groups
                 ]
 
+            levels.append((i, level))
+
+        state = None if run_id is None else self.get_dag_run_state(run_id)
+        skipped = []
+        if state is not None:
+            levels, skipped = self._filter_done_tensors(levels, state)
+            if skipped:
+                logger.info(f"Skipping the tensors done on the run {run_id}: {skipped}")
+
+        depends = {
+            tensor.path: tensor.dag.depends for _, level in levels for tensor in level
+        }
+
+        def on_done(path: str, report: dict[str, Any]):
+            if state is not None:
+                self._record_dag_tensor(state, path, depends[path], report)
+
+        if only_outdated:
+            method = functools.partial(self._exec_if_outdated, method)
+
+        if scheduler == "streaming":
+            report = self.exec_on_streaming_dag(
+                method=method,
+                tensors=[tensor for _, level in levels for tensor in level],
+                kwargs_groups=kwargs_groups,
+                max_parallelization=parallelization_kwargs.get("max_parallelization"),
+                max_parallelization_per_group=max_parallelization_per_group,
+                continue_on_error=continue_on_error,
+                callback=on_done,
+            )
+            report["skipped"] = skipped
+            return report
+
+        start = time.time()
+        reports = {}
+        failed = set()
+        blocked = []
+        for i, level in levels:
+            if continue_on_error:
+                # The tensors that depend on a failed one are not executed
+                level_blocked = [
+                    tensor.path
+                    for tensor in level
+                    if failed.intersection(tensor.dag.depends)
+                ]
+                blocked.extend(level_blocked)
+                failed.update(level_blocked)
+                level = [tensor for tensor in level if tensor.path not in failed]
+
             if not level:
                 continue
 
+            logger.info(f"Executing the {i} level of the DAG")
             for tensors in groupby_chunks(
                 level, max_parallelization_per_group, lambda tensor: tensor.dag.group
             ):
-                self.exec_on_parallel(
+                chunk_reports = self.exec_on_parallel(
                     method=method,
                     paths_kwargs={
                         tensor.path: kwargs_groups.get(tensor.dag.group, {})
                         for tensor in tensors
                     },
-                    **parallelization_kwargs,
+                    **{**parallelization_kwargs, "raise_errors": False},
                 )
+                reports.update(chunk_reports)
+                errors = []
+                for path, report in chunk_reports.items():
+                    on_done(path, report)
+                    if "error" in report:
+                        errors.append(report["error"])
+                        failed.add(path)
+
+                if errors and not continue_on_error:
+                    raise errors[0]
+
+        report = self._get_dag_report(
+            reports,
+            {path: set(depends[path]) for path in reports},
+            start,
+            blocked,
+        )
+        report["skipped"] = skipped
+        return report
+
+    def get_dag_run_state(self, run_id: str) -> dict[str, Any]:
+        """
+        Read the state of a run of :meth:`BaseTensorClient.exec_on_dag_order`, it contains the "status"
+        (done or failed) of every executed tensor, its "version" (modification_date and data_version of its
+        metadata), the version of its dependencies ("inputs") and the "start" and "end" timestamps
+        of its last execution.
+        """
+        state = self.get_custom_data(f"{self.dag_runs_path}/{run_id}")
+        return state or {"run_id": run_id, "tensors": {}}
+
+    def _get_write_versions(self, paths: list[str]) -> dict[str, Optional[list]]:
+        # Values of the metadata that change on every write of the tensor, None means that
+        # the writes are not recorded, so it is not possible to know if the tensor was modified
+        versions = {}
+        for path in paths:
+            try:
+                metadata = self.get_tensor_definition(path).metadata
+            except KeyError:
+                versions[path] = None
+                continue
+            version = [metadata.get("modification_date"), metadata.get("data_version")]
+            versions[path] = None if version == [None, None] else version
+        return versions
+
+    def _get_metadata_values(self, paths: list[str], key: str) -> dict[str, Any]:
+        values = {}
+        for path in paths:
+            try:
+                values[path] = self.get_tensor_definition(path).metadata.get(key)
+            except KeyError:
+                values[path] = None
+        return values
+
+    def is_outdated(self, path: str) -> bool:
+        """
+        Check if the tensor must be written again because the data of its DAG dependencies changed,
+        comparing the input_versions of its metadata with the current data_version of every dependency
+        (read the track_data_versions option of :meth:`TensorClient`).
+        The tensors without dependencies or without versions are always considered outdated.
+        """
+        definition = self.get_tensor_definition(path)
+        input_versions = definition.metadata.get("input_versions")
+        if (
+            definition.dag is None
+            or not definition.dag.depends
+            or input_versions is None
+            or "data_version" not in definition.metadata
+        ):
+            return True
+        return input_versions != self._get_metadata_values(
+            definition.dag.depends, "data_version"
+        )
+
+    def _exec_if_outdated(self, method: Callable, path: str, **kwargs):
+        if not self.is_outdated(path):
+            logger.info(f"The tensor {path} is up to date")
+            return None
+        return method(path=path, **kwargs)
+
+    def _filter_done_tensors(self, levels, state):
+        run_paths = {tensor.path for _, level in levels for tensor in level}
+        done = set()
+        filtered_levels = []
+        for i, level in levels:
+            pending = []
+            for tensor in level:
+                record = state["tensors"].get(tensor.path)
+                # A tensor is done only if its dependencies are not going to be executed again
+                # and neither it nor its dependencies were modified after its execution
+                if (
+                    record is not None
+                    and record["status"] == "done"
+                    and all(
+                        path in done or path not in run_paths
+                        for path in tensor.dag.depends
+                    )
+                ):
+                    versions = self._get_write_versions(
+                        [tensor.path, *tensor.dag.depends]
+                    )
+                    if None not in versions.values() and record == {
+                        **record,
+                        "version": versions.pop(tensor.path),
+                        "inputs": versions,
+                    }:
+                        done.add(tensor.path)
+                        continue
+                pending.append(tensor)
+            filtered_levels.append((i, pending))
+        return filtered_levels, sorted(done)
+
+    def _record_dag_tensor(
+        self,
+        state: dict[str, Any],
+        path: str,
+        depends: list[str],
+        report: dict[str, Any],
+    ):
+        versions = self._get_write_versions([path, *depends])
+        record = {
+            "status": "failed" if "error" in report else "done",
+            "version": versions.pop(path),
+            "inputs": versions,
+            "start": report["start"],
+            "end": report["end"],
+        }
+        if "error" in report:
+            record["error"] = str(report["error"])
+        state["tensors"][path] = record
+        self.add_custom_data(f"{self.dag_runs_path}/{state['run_id']}", state)
+
+    @staticmethod
+    def _get_dag_report(
+        reports: dict[str, dict[str, Any]],
+        dependencies: dict[str, set[str]],
+        start: float,
+        blocked: list[str],
+    ) -> dict[str, Any]:
+        timings = {
+            path: {
+                "start": report["start"] - start,
+                "end": report["end"] - start,
+                "duration": report["duration"],
+            }
+            for path, report in reports.items()
+        }
+        critical_path = dag.get_critical_path(
+            dependencies, {path: timing["duration"] for path, timing in timings.items()}
+        )
+        logger.info(f"Critical path of the DAG: {critical_path}")
+        errors = {
+            path: report["error"]
+            for path, report in reports.items()
+            if "error" in report
+        }
+        if blocked:
+            logger.warning(
+                f"Tensors not executed due to failed dependencies: {blocked}"
+            )
+        return {
+            "timings": timings,
+            "duration": time.time() - start,
+            "critical_path": critical_path,
+            "errors": errors,
+            "blocked": blocked,
+        }
+
+    def exec_on_streaming_dag(
+        self,
+        method: Union[str, Callable],
+        tensors: list[TensorDefinition],
+        kwargs_groups: dict[str, dict[str, Any]] = None,
+        max_parallelization: int = None,
+        max_parallelization_per_group: dict[str, int] = None,
+        continue_on_error: bool = False,
+        callback: Callable[[str, dict[str, Any]], Any] = None,
+    ) -> dict[str, Any]:
+        """
+        Execute the method on every tensor using a thread pool, starting every tensor as soon as all its
+        dependencies are done, so a slow tensor only delays the tensors that depend on it.
+        The dependencies that are not part of the tensors are considered done.
+        If a tensor fails no new tensors are started and the error is raised after the running ones finish,
+        unless continue_on_error is True.
+
+        Parameters
+        ----------
+
+        method: Union[str, Callable]
+            method of the tensor client that is going to be executed on parallel
+
+        tensors: List[TensorDefinition]
+            Tensors on which the method is executed, all of them must have a DAG
+
+        kwargs_groups: Dict[str, Dict[str, Any]]
+            Kwargs sent to the method base on the DAG groups
+
+        max_parallelization: int, default None
+            Maximum number of tensors executed at the same time, None means all of them.
+            It must be positive.
+
+        max_parallelization_per_group: Dict[str, int] = None
+            Maximum number of tensors of every group executed at the same time, the limits must be positive
+
+        continue_on_error: bool, default False
+            If True, a failed tensor only avoids the execution of the tensors that depend on it
+            and the errors are returned on the report instead of being raised.
+
+        callback: Callable[[str, Dict[str, Any]], Any], default None
+            Called with the path and the report of :meth:`BaseTensorClient.exec_on_parallel`
+            every time that a tensor finishes
+
+        Returns
+        -------
+        A dict with the "timings" of every tensor (start, end and duration in seconds since the beginning
+        of the execution), the total "duration", the "critical_path", which is the chain of dependencies
+        with the biggest duration, the "errors" of every failed tensor and the tensors "blocked"
+        by a failed dependency.
+        """
+        kwargs_groups = kwargs_groups or {}
+        max_parallelization_per_group = max_parallelization_per_group or {}
+        method = getattr(self, method) if isinstance(method, str) else method
+        # A limit of zero would never start the tensors of the group
+        if max_parallelization is not None and max_parallelization < 1:
+            raise ValueError(
+                f"The max_parallelization must be positive, got {max_parallelization}"
+            )
+        invalid_groups = {
+            group: limit
+            for group, limit in max_parallelization_per_group.items()
+            if limit < 1
+        }
+        if invalid_groups:
+            raise ValueError(
+                f"The limits of max_parallelization_per_group must be positive, got {invalid_groups}"
+            )
+
+        paths = {tensor.path for tensor in tensors}
+        groups = {tensor.path: tensor.dag.group for tensor in tensors}
+        dependencies = {
+            tensor.path: set(tensor.dag.depends) & paths for tensor in tensors
+        }
+        pending = {path: set(depends) for path, depends in dependencies.items()}
+        dependents = {path: [] for path in paths}
+        for path, depends in dependencies.items():
+            for dependency in depends:
+                dependents[dependency].append(path)
+
+        semaphores = {
+            group: threading.BoundedSemaphore(limit)
+            for group, limit in max_parallelization_per_group.items()
+        }
+        max_workers = min(max_parallelization or len(paths), len(paths)) or 1
+        ready = sorted(path for path, depends in pending.items() if not depends)
+        running = {}
+        reports = {}
+        error = None
+        start = time.time()
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            while ready or running:
+                waiting = []
+                for path in ready if error is None else []:
+                    semaphore = semaphores.get(groups[path])
+                    if len(running) >= max_workers or (
+                        semaphore is not None and not semaphore.acquire(blocking=False)
+                    ):
+                        waiting.append(path)
+                        continue
+
+                    logger.info(f"Processing the tensor: {path}")
+                    params = {"path": path, **kwargs_groups.get(groups[path], {})}
+                    future = executor.submit(self._exec_with_report, method, params)
+                    running[future] = path
+                ready = waiting
+
+                if not running:
+                    if ready and error is None:
+                        raise ValueError(
+                            f"The tensors {sorted(ready)} can not be started with the parallelization limits"
+                        )
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = running.pop(future)
+                    reports[path] = future.result()
+                    if groups[path] in semaphores:
+                        semaphores[groups[path]].release()
+                    if callback is not None:
+                        callback(path, reports[path])
+
+                    if "error" in reports[path]:
+                        logger.error(
+                            f"The tensor {path} failed: {reports[path]['error']}"
+                        )
+                        if not continue_on_error:
+                            error = error or reports[path]["error"]
+                        continue
+
+                    for dependent in dependents[path]:
+                        pending[dependent].discard(path)
+                        if not pending[dependent]:
+                            ready.append(dependent)
+
+        if error is not None:
+            raise error
+
+        return self._get_dag_report(
+            reports, dependencies, start, sorted(paths - reports.keys())
+        )
 
     def get_dag_for_dask(
         self,
@@ -255,15 +750,22 @@ class BaseTensorClient(Algorithms):
         map_paths: dict[str, str] = None,
         task_prefix: str = "task-",
         final_task_name: str = "WAIT",
+        only_outdated: bool = False,
     ) -> HighLevelGraph:
         """
         This method was designed to create a Dask DAG for the given method, this is useful for parallelization
         of the execution of the tensors. The exec on dag order will be deprecated in the future.
+        The only_outdated option has the same behaviour as in :meth:`BaseTensorClient.exec_on_dag_order`.
         """
         kwargs_groups = kwargs_groups or {}
         map_paths = map_paths or {}
         max_parallelization_per_group = max_parallelization_per_group or {}
         method = getattr(self, method) if isinstance(method, str) else method
+        exec_method = (
+            functools.partial(self._exec_if_outdated, method)
+            if only_outdated
+            else method
+        )
         none_func = lambda *x: None
 
         if tensors is None:
@@ -290,7 +792,7 @@ class BaseTensorClient(Algorithms):
             )
             graph[map_paths.get(path, task_prefix + path)] = (
                 func,
-                method,
+                exec_method,
                 params,
                 *tuple(map_paths.get(p, task_prefix + p) for p in depends),
             )
@@ -371,6 +873,19 @@ class BaseTensorClient(Algorithms):
             tensor_definition = self.get_tensor_definition(path)
         definition = tensor_definition.definition
 
+        track_version = (
+            self.track_data_versions
+            and isinstance(path, str)
+            and method_name in self.internal_actions
+        )
+        input_versions = None
+        if track_version and tensor_definition.dag is not None:
+            # The versions of the inputs are read before the write, so any modification
+            # made on them during the write is going to be considered as not used
+            input_versions = self._get_metadata_values(
+                tensor_definition.dag.depends, "data_version"
+            )
+
         storage = self.get_storage(path=tensor_definition)
         parameters.update(
             {
@@ -408,7 +923,33 @@ class BaseTensorClient(Algorithms):
                     return parameters["new_data"]
 
         func = getattr(storage, method_name)
-        return func(**get_parameters(func, parameters))
+        if not track_version:
+            return func(**get_parameters(func, parameters))
+
+        func_parameters = get_parameters(func, parameters)
+        result = func(**func_parameters)
+        if not func_parameters.get("compute", True):
+            # The version can only be increased after writing the data
+            return dask.delayed(self._increase_data_version)(
+                path, input_versions, result
+            )
+        self._increase_data_version(path, input_versions)
+        return result
+
+    def _increase_data_version(
+        self, path: str, input_versions: dict[str, Any] = None, *args
+    ):
+        with self._definition_write_lock(path):
+            tensor_definition = self.get_tensor_definition(path)
+            metadata = tensor_definition.metadata
+            metadata["data_version"] = metadata.get("data_version", 0) + 1
+            if input_versions is not None:
+                metadata["input_versions"] = input_versions
+            self.upsert_tensor(tensor_definition)
+
+    def _definition_write_lock(self, path: str):
+        # Lock used to read and modify the definition of the tensor without losing concurrent modifications
+        return contextlib.nullcontext()
 
     @abc.abstractmethod
     def read(
@@ -1,12 +1,18 @@
+import copy
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any, Literal, Union
 
+import orjson
 import pandas as pd
 import xarray as xr
+from loguru import logger
 from pydantic import validate_call
 from xarray.backends.common import AbstractWritableDataStore
 
 from tensordb.clients.tensor_client import BaseTensorClient, TensorClient
-from tensordb.storages import BaseStorage, Mapping, PrefixLock
+from tensordb.storages import BaseStorage, Mapping, PrefixLock, ReadThroughMapping
 from tensordb.tensor_definition import TensorDefinition
 
 
@@ -26,8 +32,41 @@ class FileCacheTensorClient(BaseTensorClient):
     default_client: Literal["local", "remote"]
         In case that a method is not overwritten by this class then it is going to automatically
         call the method on the default client
+
+    max_workers: int = 16
+        Maximum number of files transferred concurrently between the local and remote clients.
+        The files to transfer are detected comparing a listing of both clients with a manifest
+        stored on the checksum_path, so only the modified files are transferred.
+
+    fetch_mode: Literal["full", "lazy"] = "full"
+        The "full" mode transfers all the modified files of a tensor before reading it, and the "lazy" mode
+        only updates the definition and deletes the local files that were modified on the remote,
+        the rest of files are downloaded when they are read for the first time and kept on the local client,
+        so reading a small part of a tensor only downloads the chunks used.
+        The writes always transfer all the files of the tensor before modifying it.
+
+    merge_mode: Literal["sync", "background"] = "sync"
+        The "sync" mode merges the local files on the remote client before returning from every write,
+        and the "background" mode returns after writing on the local client and the merge is executed on
+        background threads, multiple writes of the same tensor made while a merge is pending are merged together.
+        Use :meth:`FileCacheTensorClient.flush` or :meth:`FileCacheTensorClient.wait_merged`
+        to wait until the data is on the remote client.
+        If the synchronizer_mode is "delayed", the writes are only merged by the flush and wait_merged methods.
+
+    merge_workers: int = 4
+        Maximum number of tensors merged at the same time by the background mode.
+
+    merge_retries: int = 3
+        Number of times that a failed background merge is retried, waiting merge_retry_wait seconds
+        multiplied by two on every attempt.
+
+    merge_retry_wait: float = 1.0
     """
 
+    lazy_key = ".zlazy"
+    # Every write updates the modification_date of the tensor (read _exec_callable)
+    _records_write_versions = True
+
     def __init__(
         self,
         remote_client: TensorClient,
@@ -36,11 +75,32 @@ class FileCacheTensorClient(BaseTensorClient):
         checksum_path: str,
         synchronizer_mode: Literal["delayed", "automatic"] = "automatic",
         default_client: Literal["local", "remote"] = "remote",
+        max_workers: int = 16,
+        fetch_mode: Literal["full", "lazy"] = "full",
+        merge_mode: Literal["sync", "background"] = "sync",
+        merge_workers: int = 4,
+        merge_retries: int = 3,
+        merge_retry_wait: float = 1.0,
     ):
         self.remote_client = remote_client
         self.local_client = local_client
         self.synchronizer_mode = synchronizer_mode
         self.tensor_lock = tensor_lock
+        self.max_workers = max_workers
+        self.fetch_mode = fetch_mode
+        self.merge_mode = merge_mode
+        self.merge_workers = merge_workers
+        self.merge_retries = merge_retries
+        self.merge_retry_wait = merge_retry_wait
+        self._init_merge_queue()
+        self.lazy_client = None
+        if fetch_mode == "lazy":
+            # Same local client but reading the files that are not local from the remote client
+            self.lazy_client = copy.copy(local_client)
+            self.lazy_client.storage_pool = None
+            self.lazy_client.base_map = ReadThroughMapping.from_mapping(
+                local_client.base_map, remote_map=remote_client.base_map
+            )
         self.checksum_map = self.local_client.base_map.sub_map(checksum_path)
         self.default_client = remote_client
         if default_client == "local":
@@ -51,6 +111,36 @@ class FileCacheTensorClient(BaseTensorClient):
             raise AttributeError(item)
         return getattr(self.default_client, item)
 
+    def _init_merge_queue(self):
+        self._merge_lock = threading.Lock()
+        self._merge_executor = None
+        # Future of the last merge of every tensor, the paths that have a merge pending or running,
+        # the paths that were written while its merge was running, the writes not merged due to the delayed mode
+        # and the error and force option of the merges that failed after all the retries
+        self._merge_futures: dict[str, Future] = {}
+        self._active_merges: set[str] = set()
+        self._dirty_merges: dict[str, bool] = {}
+        self._delayed_merges: set[str] = set()
+        self._failed_merges: dict[str, tuple[Exception, bool]] = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in [
+            "_merge_lock",
+            "_merge_executor",
+            "_merge_futures",
+            "_active_merges",
+            "_dirty_merges",
+            "_delayed_merges",
+            "_failed_merges",
+        ]:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_merge_queue()
+
     def add_custom_data(self, path, new_data):
         self.remote_client.add_custom_data(path, new_data)
 
@@ -108,8 +198,21 @@ class FileCacheTensorClient(BaseTensorClient):
         only_definition: bool = False,
     ):
         if not force and self.synchronizer_mode == "delayed":
+            with self._merge_lock:
+                self._delayed_merges.add(path)
             return
 
+        self._merge(path, force=force, only_definition=only_definition)
+        if not only_definition:
+            with self._merge_lock:
+                self._failed_merges.pop(path, None)
+
+    def _merge(
+        self,
+        path: str,
+        force: bool = False,
+        only_definition: bool = False,
+    ):
         if not self.local_client.exist(path):
             raise ValueError(
                 f"The path {path} does not exist in local so it is impossible to merge it"
@@ -153,6 +256,7 @@ class FileCacheTensorClient(BaseTensorClient):
                 checksum_map=self.checksum_map.sub_map(path),
                 force=force,
                 to_local=False,
+                max_workers=self.max_workers,
             )
 
     def fetch(
@@ -161,13 +265,19 @@ class FileCacheTensorClient(BaseTensorClient):
         force: bool = False,
         only_definition: bool = False,
     ):
-        if not self.remote_client.exist(path):
+        if not self.remote_client.exist(path) or self._merge_pending(path):
             return
 
         remote_definition = self.remote_client.get_tensor_definition(path)
         if not self.local_client.exist(path):
             force = True
 
+        lazy_map = self.checksum_map.sub_map(path)
+        if self.lazy_key in lazy_map:
+            # The local copy is incomplete, so all the files must be compared
+            force = True
+            only_definition = False
+
         if "modification_date" not in remote_definition.metadata:
             force = True
             self.remote_client.update_tensor_metadata(
@@ -206,7 +316,50 @@ class FileCacheTensorClient(BaseTensorClient):
                 checksum_map=self.checksum_map.sub_map(path),
                 force=force,
                 to_local=True,
+                max_workers=self.max_workers,
             )
+            if self.lazy_key in lazy_map:
+                del lazy_map[self.lazy_key]
+
+    def lazy_fetch(self, path: str):
+        """
+        Update the local definition of the tensor and delete the local files that were modified
+        on the remote since the last fetch, the rest of files are downloaded on demand by the lazy_client
+        """
+        if not self.remote_client.exist(path) or self._merge_pending(path):
+            return
+
+        remote_definition = self.remote_client.get_tensor_definition(path)
+        if self.local_client.exist(path) and "modification_date" in (
+            remote_definition.metadata
+        ):
+            local_definition = self.local_client.get_tensor_definition(path)
+            if local_definition.metadata.get(
+                "modification_date"
+            ) == remote_definition.metadata.get("modification_date"):
+                return
+
+        self.local_client.create_tensor(remote_definition)
+        local_map = self.local_client.base_map.sub_map(path)
+        checksum_map = self.checksum_map.sub_map(path)
+        manifest = {}
+        if Mapping.manifest_key in checksum_map:
+            manifest = orjson.loads(checksum_map[Mapping.manifest_key])
+
+        # The local files are valid if the remote did not change them since they were downloaded
+        remote_tokens = self.remote_client.base_map.sub_map(path).list_tokens()
+        stale_paths = [
+            key
+            for key in local_map.list_tokens()
+            if key not in remote_tokens
+            or manifest.get(key, {}).get("remote") != remote_tokens[key]
+        ]
+        if stale_paths:
+            local_map.delitems(stale_paths)
+        checksum_map[Mapping.manifest_key] = orjson.dumps(
+            {key: {"remote": token} for key, token in remote_tokens.items()}
+        )
+        checksum_map[self.lazy_key] = b""
 
     def _exec_callable(
         self,
@@ -221,8 +374,16 @@ class FileCacheTensorClient(BaseTensorClient):
         **kwargs,
     ):
         with self.tensor_lock[path]:
-            exist_local = self.local_client.exist(path)
-            if fetch:
+            exist_local = drop_checksums and self.local_client.exist(path)
+            if fetch and only_read and self.lazy_client is not None:
+                if not self._up_to_date(path):
+                    self.lazy_fetch(path)
+                apply_client = self.lazy_client
+            elif fetch and (
+                force
+                or self.lazy_key in self.checksum_map.sub_map(path)
+                or not self._up_to_date(path, check_data=True)
+            ):
                 self.fetch(path, force=force)
             if not only_read:
                 self.local_client.update_tensor_metadata(
@@ -233,11 +394,130 @@ class FileCacheTensorClient(BaseTensorClient):
 
             result = getattr(apply_client, func)(path=path, **kwargs)
 
-            if merge:
+            if merge and self.merge_mode == "sync":
                 self.merge(path, force=force)
 
+        if merge and self.merge_mode == "background":
+            if not force and self.synchronizer_mode == "delayed":
+                with self._merge_lock:
+                    self._delayed_merges.add(path)
+            else:
+                self._schedule_merge(path, force=force)
+
         return result
 
+    def _up_to_date(self, path: str, check_data: bool = False) -> bool:
+        # Compare only the modification dates of both definitions, which avoids the exist calls
+        # and the remote reads of the fetch when the local copy is already synchronized
+        try:
+            local_definition = self.local_client.get_tensor_definition(path)
+            remote_definition = self.remote_client.get_tensor_definition(path)
+        except KeyError:
+            return False
+        modification_date = local_definition.metadata.get("modification_date")
+        if modification_date is None or modification_date != (
+            remote_definition.metadata.get("modification_date")
+        ):
+            return False
+        # The local data can be deleted without modifying the definition (delete_tensor with only_data
+        # or a fetch of only the definition), writing over it would delete the remote data on the merge
+        return not check_data or self.local_client.exist(path)
+
+    def _merge_pending(self, path: str) -> bool:
+        # The local copy is newer than the remote until the background merge finishes
+        with self._merge_lock:
+            return path in self._active_merges or path in self._failed_merges
+
+    def _schedule_merge(self, path: str, force: bool = False) -> Future:
+        with self._merge_lock:
+            if path in self._active_merges:
+                # The merge that is pending or running is going to be repeated, so the writes are merged together
+                self._dirty_merges[path] = self._dirty_merges.get(path, False) or force
+                return self._merge_futures[path]
+
+            if self._merge_executor is None:
+                self._merge_executor = ThreadPoolExecutor(self.merge_workers)
+            self._active_merges.add(path)
+            # The writes of a failed merge are merged again with the new ones
+            self._dirty_merges[path] = (
+                force or self._failed_merges.get(path, (None, False))[1]
+            )
+            future = self._merge_executor.submit(self._background_merge, path)
+            self._merge_futures[path] = future
+            return future
+
+    def _background_merge(self, path: str):
+        while True:
+            with self._merge_lock:
+                force = self._dirty_merges.pop(path, False)
+
+            for attempt in range(self.merge_retries + 1):
+                try:
+                    with self.tensor_lock[path]:
+                        self._merge(path, force=force)
+                    break
+                except Exception as e:
+                    if attempt == self.merge_retries:
+                        logger.exception(f"The merge of the tensor {path} failed")
+                        with self._merge_lock:
+                            # The local writes, including the ones made during the merge, are kept
+                            # as not merged until a new merge of the tensor finishes
+                            self._active_merges.discard(path)
+                            self._failed_merges[path] = (
+                                e,
+                                force or self._dirty_merges.pop(path, False),
+                            )
+                        raise
+                    logger.warning(f"Retrying the merge of the tensor {path}: {e}")
+                    time.sleep(self.merge_retry_wait * 2**attempt)
+
+            with self._merge_lock:
+                self._failed_merges.pop(path, None)
+                if path not in self._dirty_merges:
+                    self._active_merges.discard(path)
+                    return
+
+    def wait_merged(self, path: str):
+        """
+        Wait until all the writes of the tensor are merged on the remote client, including the ones
+        that were not merged due to the delayed synchronizer_mode. The error of the last merge is raised,
+        and the writes of a failed merge are only merged again by a new write or :meth:`FileCacheTensorClient.merge`.
+        """
+        with self._merge_lock:
+            delayed = path in self._delayed_merges
+            self._delayed_merges.discard(path)
+
+        if delayed and self.merge_mode == "sync":
+            with self.tensor_lock[path]:
+                self._merge(path)
+            return
+        if delayed:
+            self._schedule_merge(path)
+
+        future = self._merge_futures.get(path)
+        if future is not None:
+            future.result()
+        with self._merge_lock:
+            error = self._failed_merges.get(path, (None, False))[0]
+        if error is not None:
+            raise error
+
+    def flush(self):
+        """
+        Wait until all the writes are merged on the remote client, read :meth:`FileCacheTensorClient.wait_merged`.
+        The error of the first failed merge is raised after waiting all of them.
+        """
+        with self._merge_lock:
+            paths = set(self._delayed_merges) | set(self._merge_futures)
+        errors = []
+        for path in sorted(paths):
+            try:
+                self.wait_merged(path)
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
     def read(
         self, path: Union[str, TensorDefinition, xr.DataArray, xr.Dataset], **kwargs
     ) -> Union[xr.DataArray, xr.Dataset]:
@@ -1,6 +1,10 @@
+import contextlib
+import threading
 from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Literal, Union
 
+import more_itertools as mit
 import orjson
 import xarray as xr
 from pydantic import validate_call
@@ -8,9 +12,22 @@ from xarray.backends.common import AbstractWritableDataStore
 
 from tensordb.algorithms import Algorithms
 from tensordb.clients.base import BaseTensorClient
-from tensordb.storages import MAPPING_STORAGES, BaseStorage, JsonStorage, PrefixLock
+from tensordb.storages import (
+    MAPPING_STORAGES,
+    BaseStorage,
+    CachingMapping,
+    JsonStorage,
+    PrefixLock,
+    ZarrStorage,
+)
 from tensordb.storages.mapping import Mapping
 from tensordb.tensor_definition import TensorDefinition
+from tensordb.utils.cache import LRUCache
+
+# Serialize the modifications of the definitions catalog made by the threads of the process
+_catalog_lock = threading.Lock()
+# Serialize the read-modify-write of the definitions made by the threads of the process
+_definition_lock = threading.Lock()
 
 
 class TensorClient(BaseTensorClient, Algorithms):
@@ -50,6 +67,47 @@ class TensorClient(BaseTensorClient, Algorithms):
         synchronizer option for every one of them.
         The Mapping class provided by this library offers a lock solution for this purpose.
 
+    definition_cache_size: int = None
+        Maximum number of tensor definitions kept in memory, by default the cache is disabled and every
+        call to :meth:`TensorClient.get_tensor_definition` reads the definition from the base_map.
+        The cache is invalidated by the create_tensor, upsert_tensor and delete_tensor methods.
+
+    definition_cache_ttl: float = None
+        Number of seconds that a cached definition is considered valid, None means that it never expires.
+
+    definition_cache_validation: Literal["etag", "mtime"] = None
+        Validate the cached definitions using the etag or the modification time of the definition file,
+        this only requires a metadata request to the file system, and it is useful when multiple processes
+        share the same base_map. It requires a base_map that exposes an fsspec file system and
+        the definition_cache_size or the definition_cache_ttl option.
+
+    storage_pool_size: int = None
+        Maximum number of storages kept in memory by :meth:`TensorClient.get_storage`, the storages are
+        identified by the path and the storage definition of the tensor, so any change on the definition
+        generates a new storage. By default, a new storage is created on every call.
+        The hits and misses of the pool can be consulted using ``storage_pool.info()``.
+
+    definitions_catalog: bool = False
+        Keep all the tensor definitions consolidated in a unique file with a version counter,
+        the file is updated by the create_tensor, upsert_tensor and delete_tensor methods and is used by
+        :meth:`TensorClient.get_all_tensors_definition`, so planning a DAG only requires a few reads.
+        If the catalog is missing or does not contain the same tensors as the stored definitions
+        then every definition is read independently.
+        Take into consideration that all the clients writing definitions must enable this option.
+
+    chunk_cache: Union[int, Dict[str, Any]] = None
+        Keep the files read from the base_map (chunks, metadata and definitions) on a
+        :class:`tensordb.storages.CachingMapping`, an int indicates the maximum number of bytes kept in memory,
+        and a dict is sent as the parameters of the CachingMapping, for example, to add a disk tier.
+        By default, the files are not cached.
+
+    track_data_versions: bool = False
+        Increase the data_version of the metadata of the tensor after every write, and record the data_version
+        of its DAG dependencies at the beginning of the write as its input_versions, this allows to
+        skip the tensors that are up to date using the only_outdated option of
+        :meth:`TensorClient.exec_on_dag_order` and :meth:`TensorClient.get_dag_for_dask`.
+        Every write requires an additional write of the definition.
+
     **kwargs: Dict
         Useful when you want to inherent from this class.
 
@@ -167,6 +225,7 @@ class TensorClient(BaseTensorClient, Algorithms):
     # TODO: Add more examples to the documentation
 
     internal_actions = ["store", "update", "append", "upsert", "drop"]
+    consolidated_key = ".zdefinitions"
 
     def __init__(
         self,
@@ -174,11 +233,22 @@ class TensorClient(BaseTensorClient, Algorithms):
         tmp_map: MutableMapping = None,
         synchronizer: Union[Literal["process", "thread"], None, PrefixLock] = None,
         synchronize_only_write: bool = False,
+        definition_cache_size: int = None,
+        definition_cache_ttl: float = None,
+        definition_cache_validation: Literal["etag", "mtime"] = None,
+        storage_pool_size: int = None,
+        definitions_catalog: bool = False,
+        chunk_cache: Union[int, dict[str, Any]] = None,
+        track_data_versions: bool = False,
         **kwargs,
     ):
         self.base_map = base_map
         if not isinstance(base_map, Mapping):
             self.base_map: Mapping = Mapping(base_map)
+        if chunk_cache is not None:
+            if isinstance(chunk_cache, int):
+                chunk_cache = {"maxsize": chunk_cache}
+            self.base_map = CachingMapping.from_mapping(self.base_map, **chunk_cache)
 
         self.tmp_map = self.base_map.sub_map("tmp") if tmp_map is None else tmp_map
         if not isinstance(self.tmp_map, Mapping):
@@ -192,6 +262,33 @@ class TensorClient(BaseTensorClient, Algorithms):
             tmp_map=self.tmp_map.sub_map("_tensors_definition"),
         )
 
+        if (
+            definition_cache_validation is not None
+            and definition_cache_size is None
+            and definition_cache_ttl is None
+        ):
+            raise ValueError(
+                "The validation of the definition cache requires the definition_cache_size "
+                "or the definition_cache_ttl option"
+            )
+        if definition_cache_validation is not None and not hasattr(
+            self.base_map.mapper, "fs"
+        ):
+            raise ValueError(
+                "The validation of the definition cache requires a base_map with an fsspec file system"
+            )
+        self.definition_cache_validation = definition_cache_validation
+        self._definitions_cache = None
+        if definition_cache_size is not None or definition_cache_ttl is not None:
+            self._definitions_cache = LRUCache(
+                maxsize=definition_cache_size, ttl=definition_cache_ttl
+            )
+        self.storage_pool = None
+        if storage_pool_size is not None:
+            self.storage_pool = LRUCache(maxsize=storage_pool_size)
+        self.definitions_catalog = definitions_catalog
+        self.track_data_versions = track_data_versions
+
     def add_custom_data(self, path, new_data: dict):
         self.base_map[path] = orjson.dumps(new_data, option=orjson.OPT_SERIALIZE_NUMPY)
 
@@ -215,6 +312,11 @@ class TensorClient(BaseTensorClient, Algorithms):
         self._tensors_definition.store(
             path=definition.path, new_data=definition.model_dump(exclude_unset=True)
         )
+        self._invalidate_definition(definition.path)
+        if self.definitions_catalog:
+            self._update_catalog(
+                definition.path, definition.model_dump(exclude_unset=True)
+            )
 
     @validate_call
     def upsert_tensor(self, definition: TensorDefinition):
@@ -231,6 +333,11 @@ class TensorClient(BaseTensorClient, Algorithms):
         self._tensors_definition.upsert(
             path=definition.path, new_data=definition.model_dump()
         )
+        self._invalidate_definition(definition.path)
+        if self.definitions_catalog:
+            self._update_catalog(
+                definition.path, self._tensors_definition.read(definition.path)
+            )
 
     @validate_call
     def get_tensor_definition(self, path: str) -> TensorDefinition:
@@ -248,29 +355,251 @@ class TensorClient(BaseTensorClient, Algorithms):
 
         """
         try:
-            return TensorDefinition(**self._tensors_definition.read(path))
+            if self._definitions_cache is None:
+                return self._read_tensor_definition(path)
+
+            token = None
+            if self.definition_cache_validation is not None:
+                token = self._tensors_definition.base_map.version_token(
+                    self._tensors_definition.to_json_file_name(path),
+                    method=self.definition_cache_validation,
+                )
+
+            cached = self._definitions_cache.get(path)
+            if cached is None or cached[1] != token:
+                cached = (self._read_tensor_definition(path), token)
+                self._definitions_cache[path] = cached
+
+            # The definitions are mutable, so a copy is returned to keep the cache untouched
+            return cached[0].model_copy(deep=True)
         except KeyError as e:
+            self._invalidate_definition(path)
             raise KeyError(
                 f"The tensor {path} has not been created using the create_tensor method"
             ) from e
 
+    def _read_tensor_definition(self, path: str) -> TensorDefinition:
+        return TensorDefinition(**self._tensors_definition.read(path))
+
+    def _invalidate_definition(self, path: str):
+        if self._definitions_cache is not None:
+            self._definitions_cache.pop(path)
+        if self.storage_pool is not None:
+            for key in self.storage_pool.keys():
+                if key[0] == path:
+                    self.storage_pool.pop(key)
+
     @validate_call
     def update_tensor_metadata(self, path: str, new_metadata: dict[str, Any]):
         tensor_definition = self.get_tensor_definition(path)
         tensor_definition.metadata.update(new_metadata)
         self.upsert_tensor(tensor_definition)
 
-    def get_all_tensors_definition(self) -> list[TensorDefinition]:
-        from concurrent.futures import ThreadPoolExecutor
+    def get_all_tensors_definition(
+        self,
+        consolidated: bool = None,
+        batch_size: int = 256,
+        max_workers: int = 8,
+    ) -> list[TensorDefinition]:
+        """
+        Retrieve the definitions of all the tensors, the files are read in batches using the
+        getitems method of the base_map, which allows to make concurrent requests if the
+        file system supports it.
+
+        Parameters
+        ----------
+        consolidated: bool, default None
+            True reads the definitions from the consolidated file created by
+            :meth:`TensorClient.consolidate_definitions` using a unique request, the file is used as it is,
+            so it can be outdated if it is not maintained by the definitions_catalog option,
+            and if the file does not exist then all the definitions are read one by one.
+            By default, the consolidated file is only used if the definitions_catalog option is enabled,
+            and it is validated comparing the tokens (etag or modification time) of the stored definitions
+            with the ones recorded on the file, so only the modified definitions are read again.
+
+        batch_size: int, default 256
+            Number of definitions read on every call to getitems.
 
-        with ThreadPoolExecutor() as executor:
-            results = list(
-                executor.map(
-                    self.get_tensor_definition,
-                    list(self._tensors_definition.base_map.keys()),
+        max_workers: int, default 8
+            Maximum number of batches read in parallel.
+
+        Returns
+        -------
+        A list of `TensorDefinition`
+        """
+        base_map = self._tensors_definition.base_map
+        if consolidated:
+            catalog = self._read_catalog()
+            if catalog is not None:
+                return [
+                    self._cache_definition(TensorDefinition(**definition))
+                    for definition in catalog["definitions"].values()
+                ]
+
+        if consolidated is None and self.definitions_catalog:
+            catalog = self._read_catalog() or {}
+            tokens = self._list_definition_tokens()
+            definitions = catalog.get("definitions", {})
+            catalog_tokens = catalog.get("tokens", {})
+            # Only the definitions modified after the last write of the catalog are read
+            modified_keys = {
+                key
+                for key, token in tokens.items()
+                if token is None
+                or catalog_tokens.get(key) != token
+                or self._tensors_definition.get_original_path(key) not in definitions
+            }
+            modified = self._read_definitions(
+                sorted(modified_keys), batch_size=batch_size, max_workers=max_workers
+            )
+            return [
+                self._cache_definition(
+                    modified[key]
+                    if key in modified
+                    else TensorDefinition(
+                        **definitions[self._tensors_definition.get_original_path(key)]
+                    )
                 )
+                for key in tokens
+                if key in modified or key not in modified_keys
+            ]
+
+        keys = [key for key in base_map.keys() if key != self.consolidated_key]
+        definitions = self._read_definitions(
+            keys, batch_size=batch_size, max_workers=max_workers
+        )
+        return [
+            self._cache_definition(definition) for definition in definitions.values()
+        ]
+
+    def _read_definitions(
+        self, keys: list[str], batch_size: int, max_workers: int
+    ) -> dict[str, TensorDefinition]:
+        base_map = self._tensors_definition.base_map
+        with ThreadPoolExecutor(max_workers) as executor:
+            batches = list(
+                executor.map(base_map.getitems, mit.chunked(keys, batch_size))
+            )
+
+        values = {key: value for batch in batches for key, value in batch.items()}
+        # The definition can be deleted after listing the keys
+        return {
+            key: TensorDefinition(**orjson.loads(values[key]))
+            for key in keys
+            if key in values
+        }
+
+    def _definition_token(self, key: str) -> Union[str, None]:
+        base_map = self._tensors_definition.base_map
+        if not hasattr(base_map.mapper, "fs"):
+            return self._list_definition_tokens().get(key)
+        try:
+            return base_map.version_token(key)
+        except KeyError:
+            return None
+
+    def _list_definition_tokens(self) -> dict[str, Union[str, None]]:
+        # Token of every stored definition using a unique listing
+        return {
+            key: token
+            for key, token in self._tensors_definition.base_map.list_tokens().items()
+            if key != self.consolidated_key
+        }
+
+    def _cache_definition(self, definition: TensorDefinition) -> TensorDefinition:
+        # Without validation there is no token to compare, so the bulk reads can prime the cache
+        if (
+            self._definitions_cache is not None
+            and self.definition_cache_validation is None
+        ):
+            self._definitions_cache[definition.path] = (definition, None)
+            return definition.model_copy(deep=True)
+        return definition
+
+    def consolidate_definitions(self):
+        """
+        Store all the tensor definitions in a unique file, similar to the consolidated metadata of Zarr,
+        so they can be read with a unique request using the consolidated option of
+        :meth:`TensorClient.get_all_tensors_definition`.
+        The file is only updated automatically if the definitions_catalog option is enabled.
+        """
+        with self._catalog_write_lock():
+            self._write_catalog(self._read_catalog(), *self._build_catalog())
+
+    def _catalog_write_lock(self):
+        base_map = self._tensors_definition.base_map
+        lock = base_map.write_lock[
+            base_map.add_lock_path(f"{self.consolidated_key}.lock")
+        ]
+        stack = contextlib.ExitStack()
+        stack.enter_context(_catalog_lock)
+        stack.enter_context(lock)
+        return stack
+
+    def _definition_write_lock(self, path: str):
+        base_map = self._tensors_definition.base_map
+        lock = base_map.write_lock[base_map.add_lock_path(f"{path}.lock")]
+        stack = contextlib.ExitStack()
+        stack.enter_context(_definition_lock)
+        stack.enter_context(lock)
+        return stack
+
+    def _read_catalog(self) -> Union[dict, None]:
+        try:
+            return orjson.loads(
+                self._tensors_definition.base_map[self.consolidated_key]
             )
-        return results
+        except (KeyError, orjson.JSONDecodeError):
+            return None
+
+    def _build_catalog(self) -> tuple[dict[str, dict], dict[str, Union[str, None]]]:
+        # The tokens are listed before reading the definitions, so a definition modified
+        # in the middle has an old token and is read again by the next validation
+        tokens = self._list_definition_tokens()
+        definitions = {
+            definition.path: definition.model_dump(exclude_unset=True)
+            for definition in self.get_all_tensors_definition(consolidated=False)
+        }
+        return definitions, tokens
+
+    def _write_catalog(
+        self,
+        catalog: Union[dict, None],
+        definitions: dict[str, dict],
+        tokens: dict[str, Union[str, None]],
+    ):
+        version = 0 if catalog is None else catalog["version"] + 1
+        self._tensors_definition.base_map[self.consolidated_key] = orjson.dumps(
+            {"version": version, "definitions": definitions, "tokens": tokens},
+            option=orjson.OPT_SERIALIZE_NUMPY,
+        )
+
+    def _update_catalog(self, path: str, definition: Union[dict, None]):
+        with self._catalog_write_lock():
+            catalog = self._read_catalog()
+            if catalog is None:
+                # The definition file was already written, so the new catalog contains the change
+                self._write_catalog(catalog, *self._build_catalog())
+                return
+
+            definitions = catalog["definitions"]
+            tokens = catalog.get("tokens", {})
+            key = self._tensors_definition.to_json_file_name(path)
+            if definition is None:
+                definitions.pop(path, None)
+                tokens.pop(key, None)
+            else:
+                definitions[path] = definition
+                tokens[key] = self._definition_token(key)
+            self._write_catalog(catalog, definitions, tokens)
+
+    def get_catalog_version(self) -> Union[int, None]:
+        """
+        Version of the definitions catalog, it is increased on every modification of the catalog,
+        None means that the catalog does not exist.
+        """
+        catalog = self._read_catalog()
+        return None if catalog is None else catalog["version"]
 
     @validate_call
     def delete_tensor(self, path: str, only_data: bool = False) -> Any:
@@ -291,6 +620,49 @@ class TensorClient(BaseTensorClient, Algorithms):
         storage.delete_tensor()
         if not only_data:
             self._tensors_definition.delete_file(path)
+            self._invalidate_definition(path)
+            if self.definitions_catalog:
+                self._update_catalog(path, None)
+
+    @validate_call
+    def snapshot(self, path: Union[str, TensorDefinition], name: str = None) -> str:
+        """
+        Calls :meth:`ZarrStorage.snapshot`, the snapshot can be read using the version
+        parameter of the read method.
+
+        Returns
+        -------
+        The name of the snapshot
+        """
+        return self.get_storage(path).snapshot(name=name)
+
+    @validate_call
+    def restore_snapshot(self, path: Union[str, TensorDefinition], name: str):
+        """
+        Calls :meth:`ZarrStorage.restore_snapshot`
+        """
+        self.get_storage(path).restore_snapshot(name=name)
+
+    @validate_call
+    def delete_snapshot(self, path: Union[str, TensorDefinition], name: str):
+        """
+        Calls :meth:`ZarrStorage.delete_snapshot`
+        """
+        self.get_storage(path).delete_snapshot(name=name)
+
+    @validate_call
+    def get_snapshots(self, path: Union[str, TensorDefinition]) -> dict[str, int]:
+        """
+        Calls :meth:`ZarrStorage.get_snapshots`
+        """
+        return self.get_storage(path).get_snapshots()
+
+    @validate_call
+    def compact(self, path: Union[str, TensorDefinition]) -> list:
+        """
+        Calls :meth:`ZarrStorage.compact`
+        """
+        return self.get_storage(path).compact()
 
     @validate_call
     def get_storage(self, path: Union[str, TensorDefinition]) -> BaseStorage:
@@ -307,8 +679,22 @@ class TensorClient(BaseTensorClient, Algorithms):
         A BaseStorage object
         """
         definition = self.get_tensor_definition(path) if isinstance(path, str) else path
-
-        storage = MAPPING_STORAGES["zarr_storage"]
+        storage_definition = definition.storage.model_dump(exclude_unset=True)
+
+        pool_key = None
+        if self.storage_pool is not None:
+            pool_key = (
+                definition.path,
+                hash(
+                    orjson.dumps(
+                        storage_definition,
+                        option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+                    )
+                ),
+            )
+            storage = self.storage_pool.get(pool_key)
+            if storage is not None:
+                return storage
 
         storage = MAPPING_STORAGES[definition.storage.storage_name]
         storage = storage(
@@ -316,8 +702,10 @@ class TensorClient(BaseTensorClient, Algorithms):
             tmp_map=self.tmp_map.sub_map(definition.path),
             synchronizer=self.synchronizer,
             synchronize_only_write=self.synchronize_only_write,
-            **definition.storage.model_dump(exclude_unset=True),
+            **storage_definition,
         )
+        if self.storage_pool is not None:
+            self.storage_pool[pool_key] = storage
         return storage
 
     def read(
@@ -430,11 +818,53 @@ class TensorClient(BaseTensorClient, Algorithms):
             exist_definition = self._tensors_definition.exist(path)
             if only_definition or (not exist_definition):
                 return exist_definition
-            self.read(path=path, **kwargs)
-            return True
+
+            definition = self.get_tensor_definition(path)
+            if kwargs or "read" in definition.definition:
+                # The read can be modified by the definition, so the only way of
+                # knowing if the tensor exists is reading it
+                self.read(path=path, **kwargs)
+                return True
+            return self.get_storage(definition).exist()
         except KeyError:
             return False
 
+    def bulk_exist(self, paths: list[str]) -> dict[str, bool]:
+        """
+        Equivalent to call :meth:`TensorClient.exist` for every path, but the consolidated metadata of
+        all the Zarr tensors is read using a unique call to the getitems method of the base_map,
+        which allows to make concurrent requests if the file system supports it.
+
+        Parameters
+        ----------
+        paths: List[str]
+            Paths of the tensors
+
+        Returns
+        -------
+        A dict whose keys are the paths and the values indicate if the tensor exist or not
+        """
+        exist = {}
+        storages = {}
+        for path in paths:
+            try:
+                definition = self.get_tensor_definition(path)
+            except KeyError:
+                exist[path] = False
+                continue
+
+            storage = self.get_storage(definition)
+            if "read" in definition.definition or not isinstance(storage, ZarrStorage):
+                exist[path] = self.exist(path)
+                continue
+            storages[f"{path}/{storage.metadata_key}"] = (path, storage)
+
+        metadata = self.base_map.getitems(list(storages))
+        for key, (path, storage) in storages.items():
+            exist[path] = key in metadata and storage.exist_on_metadata(metadata[key])
+
+        return {path: exist[path] for path in paths}
+
     def read_from_formula(
         self,
         formula: str,
@@ -1,18 +1,24 @@
 from tensordb.storages.base_storage import BaseStorage
 from tensordb.storages.cached_storage import CachedStorage
+from tensordb.storages.caching_mapping import CachingMapping
 from tensordb.storages.json_storage import JsonStorage
+from tensordb.storages.layered_mapping import LayeredMapping
 from tensordb.storages.lock import NoLock, PrefixLock
 from tensordb.storages.mapping import Mapping
+from tensordb.storages.read_through_mapping import ReadThroughMapping
 from tensordb.storages.variables import MAPPING_STORAGES
 from tensordb.storages.zarr_storage import ZarrStorage
 
 __all__ = (
     "BaseStorage",
     "CachedStorage",
+    "CachingMapping",
     "JsonStorage",
+    "LayeredMapping",
     "NoLock",
     "PrefixLock",
     "Mapping",
     "MAPPING_STORAGES",
+    "ReadThroughMapping",
     "ZarrStorage",
 )
@@ -0,0 +1,215 @@
+import contextlib
+import hashlib
+import posixpath
+from collections.abc import MutableMapping
+from typing import Optional
+
+from tensordb.storages.lock import PrefixLock
+from tensordb.storages.mapping import Mapping
+from tensordb.utils.cache import LRUCache
+
+
+def _entry_size(entry: tuple[Optional[str], bytes]) -> int:
+    return len(entry[1])
+
+
+class CachingMapping(Mapping):
+    """
+    Mapping that keeps the values read in a LRU cache bounded by the number of bytes, and optionally
+    in a second tier located on another mapping (for example, a local disk), so reading multiple times
+    the same chunks of a tensor only downloads them once.
+
+    Every entry is identified by the complete path of the key and by default it is validated using
+    the etag (or modification time) and size of the file before using it, which only requires a metadata
+    request to the file system (the getitems method sends the requests of all the keys concurrently).
+    The entries are invalidated by any write or delete made through the mapping or any of its sub maps,
+    which share the same cache.
+
+    Parameters
+    ----------
+
+    maxsize: int, default 268435456
+        Maximum number of bytes kept in memory.
+
+    disk_map: MutableMapping, default None
+        Mapping used as a second tier of the cache, the values evicted from memory are read from it
+        before going to the original mapper, by default there is no second tier. The entries are stored
+        on the folders of their paths, so the entries of a deleted prefix are found without listing all of them.
+
+    validate: bool, default True
+        Validate the entries with the etag and size of the file, this is only possible if the mapper exposes
+        an fsspec file system. Disable it only if the mapping is the unique writer of the data.
+
+    cache: LRUCache, default None
+        Cache shared with other mappings, by default a new one is created using the maxsize.
+    """
+
+    def __init__(
+        self,
+        mapper: MutableMapping,
+        sub_path: str = None,
+        read_lock: PrefixLock = None,
+        write_lock: PrefixLock = None,
+        root: str = None,
+        enable_sub_map: bool = True,
+        maxsize: int = 2**28,
+        disk_map: MutableMapping = None,
+        validate: bool = True,
+        cache: LRUCache = None,
+    ):
+        super().__init__(
+            mapper=mapper,
+            sub_path=sub_path,
+            read_lock=read_lock,
+            write_lock=write_lock,
+            root=root,
+            enable_sub_map=enable_sub_map,
+        )
+        if cache is None:
+            cache = LRUCache(maxsize=maxsize, getsizeof=_entry_size)
+        self.cache = cache
+        if disk_map is not None and not isinstance(disk_map, Mapping):
+            disk_map = Mapping(disk_map)
+        self.disk_map = disk_map
+        self.validate = validate and hasattr(mapper, "fs")
+
+    @classmethod
+    def from_mapping(cls, mapping: Mapping, **kwargs) -> "CachingMapping":
+        """
+        Add the cache to an existing mapping, the kwargs are sent to the constructor.
+        """
+        return cls(
+            mapper=mapping.mapper,
+            sub_path=mapping.sub_path,
+            read_lock=mapping.read_lock,
+            write_lock=mapping.write_lock,
+            root=mapping._root,
+            enable_sub_map=mapping.enable_sub_map,
+            **kwargs,
+        )
+
+    def sub_map(self, sub_path):
+        return self.from_mapping(
+            super().sub_map(sub_path),
+            disk_map=self.disk_map,
+            validate=self.validate,
+            cache=self.cache,
+        )
+
+    def _token(self, key) -> Optional[str]:
+        # Raise a KeyError if the key does not exist
+        if not self.validate:
+            return None
+        return self.version_token(key)
+
+    def _tokens(self, keys) -> dict[str, Optional[str]]:
+        # Omit the missing keys, the metadata of all of them is requested concurrently
+        if not self.validate:
+            return {key: None for key in keys}
+        return self.version_tokens(keys)
+
+    @staticmethod
+    def _disk_key(cache_key: str) -> str:
+        return hashlib.sha256(cache_key.encode()).hexdigest()
+
+    @staticmethod
+    def _disk_folder(prefix: str) -> str:
+        # Keep the structure of the path, so the entries of a prefix are on the same folder of the disk
+        return prefix.replace("://", "/").strip("/")
+
+    def _disk_path(self, cache_key: str) -> str:
+        folder = self._disk_folder(posixpath.dirname(cache_key))
+        disk_key = self._disk_key(cache_key)
+        return f"{folder}/{disk_key}" if folder else disk_key
+
+    def _get_cached(self, cache_key: str, token: Optional[str]) -> Optional[bytes]:
+        entry = self.cache.get(cache_key)
+        if entry is None and self.disk_map is not None:
+            try:
+                value = self.disk_map[self._disk_path(cache_key)]
+            except KeyError:
+                value = None
+            if value is not None:
+                # The token is stored at the beginning of the value
+                disk_token, _, value = value.partition(b"\0")
+                entry = (disk_token.decode() or None, value)
+                self.cache[cache_key] = entry
+
+        if entry is None or entry[0] != token:
+            return None
+        return entry[1]
+
+    def _set_cached(self, cache_key: str, token: Optional[str], value: bytes):
+        value = bytes(value)
+        self.cache[cache_key] = (token, value)
+        if self.disk_map is not None:
+            token = b"" if token is None else token.encode()
+            self.disk_map[self._disk_path(cache_key)] = token + b"\0" + value
+
+    def invalidate(self, key):
+        cache_key = self.full_path(key)
+        self.cache.pop(cache_key)
+        if self.disk_map is not None:
+            with contextlib.suppress(KeyError):
+                del self.disk_map[self._disk_path(cache_key)]
+
+    def invalidate_prefix(self, path=None):
+        prefix = self.full_path(path)
+        for cache_key in self.cache.keys():
+            if prefix is None or cache_key.startswith(f"{prefix}/"):
+                self.cache.pop(cache_key)
+        if self.disk_map is None:
+            return
+        self.disk_map.rmdir(None if prefix is None else self._disk_folder(prefix))
+
+    def __getitem__(self, key):
+        cache_key = self.full_path(key)
+        token = self._token(key)
+        value = self._get_cached(cache_key, token)
+        if value is None:
+            value = super().__getitem__(key)
+            self._set_cached(cache_key, token, value)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.invalidate(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.invalidate(key)
+
+    def __contains__(self, key):
+        if not self.validate and self.full_path(key) in self.cache:
+            return True
+        return super().__contains__(key)
+
+    def setitems(self, values):
+        super().setitems(values)
+        for key in values:
+            self.invalidate(key)
+
+    def getitems(self, keys, **kwargs):
+        values = {}
+        tokens = {}
+        for key, token in self._tokens(keys).items():
+            value = self._get_cached(self.full_path(key), token)
+            if value is None:
+                tokens[key] = token
+            else:
+                values[key] = value
+
+        if tokens:
+            for key, value in super().getitems(list(tokens), **kwargs).items():
+                self._set_cached(self.full_path(key), tokens[key], value)
+                values[key] = value
+        return values
+
+    def delitems(self, keys, **kwargs):
+        super().delitems(keys, **kwargs)
+        for key in keys:
+            self.invalidate(key)
+
+    def rmdir(self, path=None, **kwargs):
+        super().rmdir(path, **kwargs)
+        self.invalidate_prefix(path)
@@ -0,0 +1,65 @@
+from collections.abc import MutableMapping
+
+
+class LayeredMapping(MutableMapping):
+    """
+    Mapping that reads a stack of mappings as if they were only one, the keys are searched from the
+    first layer to the last one, and all the modifications are written on the first layer, so the rest
+    of layers are never modified (copy on write).
+
+    The keys that are deleted but exist on the deeper layers are marked on the first layer using
+    an empty value, which is never a valid Zarr file.
+
+    Parameters
+    ----------
+
+    layers: List[MutableMapping]
+        Mappings ordered from the newest (the one that receives the writes) to the oldest
+    """
+
+    def __init__(self, layers: list[MutableMapping]):
+        self.layers = layers
+
+    def __getitem__(self, key):
+        for layer in self.layers:
+            try:
+                value = layer[key]
+            except KeyError:
+                continue
+            if len(value) == 0:
+                raise KeyError(key)
+            return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self.layers[0][key] = value
+
+    def __delitem__(self, key):
+        if not any(key in layer for layer in self.layers[1:]):
+            del self.layers[0][key]
+            return
+        # Raise a KeyError if the key was already deleted
+        self[key]
+        self.layers[0][key] = b""
+
+    def __iter__(self):
+        layers_keys = [set(layer) for layer in self.layers]
+        seen = set()
+        for i, keys in enumerate(layers_keys):
+            for key in keys - seen:
+                seen.add(key)
+                # Only the keys of the deeper layers can be marked as deleted
+                if any(key in deeper for deeper in layers_keys[i + 1 :]):
+                    if len(self.layers[i][key]) == 0:
+                        continue
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
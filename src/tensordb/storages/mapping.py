@@ -1,11 +1,19 @@
-import os
+import asyncio
+import contextlib
+import hashlib
 from collections.abc import MutableMapping
 from concurrent.futures import ThreadPoolExecutor
-from typing import Literal
+from typing import Literal, Optional
 
-from zarr.storage import FSStore
+import fsspec.asyn
+import more_itertools as mit
+import orjson
+import pandas as pd
+from fsspec.mapping import FSMap
+from loguru import logger
+from zarr.storage import BaseStore, FSStore, KVStore
 
-from tensordb.storages.lock import PrefixLock
+from tensordb.storages.lock import NoLock, PrefixLock
 
 
 class Mapping(MutableMapping):
@@ -96,7 +104,7 @@ class Mapping(MutableMapping):
 
     def __iter__(self):
         for key in self.mapper:
-            if self.enable_sub_map:
+            if self.enable_sub_map or self.sub_path is None:
                 yield key
             elif key.startswith(self.sub_path):
                 yield key[len(self.sub_path) + 1 :]
@@ -108,16 +116,62 @@ class Mapping(MutableMapping):
         key = self.add_sub_path(key)
         return key in self.mapper
 
+    @contextlib.contextmanager
+    def lock_keys(self, lock: PrefixLock, keys):
+        # Acquire the locks of all the keys always in the same order (sorted and without duplicates),
+        # so two batches that share keys can not generate a deadlock
+        with contextlib.ExitStack() as stack:
+            for lock_path in sorted({self.add_lock_path(key) for key in keys}):
+                stack.enter_context(lock[lock_path])
+            yield
+
     def setitems(self, values):
-        # Not possible to lock
-        self.mapper.setitems({self.add_sub_path(k): v for k, v in values.items()})
+        # The locks are acquired first and then all the values are written using a unique bulk request
+        with self.lock_keys(self.write_lock, values):
+            if not hasattr(self.mapper, "setitems"):
+                for k, v in values.items():
+                    self.mapper[self.add_sub_path(k)] = v
+                return
+            values = {self.add_sub_path(k): v for k, v in values.items()}
+            fs_map = (
+                self.mapper.map if isinstance(self.mapper, FSStore) else self.mapper
+            )
+            if isinstance(fs_map, FSMap):
+                # Unlike the item assignment, the bulk write does not create the folders
+                folders = {fs_map.fs._parent(fs_map._key_to_str(k)) for k in values}
+                for folder in folders:
+                    fs_map.fs.mkdirs(folder, exist_ok=True)
+            self.mapper.setitems(values)
 
     def getitems(self, keys, **kwargs):
-        # Not possible to lock
-        return self.mapper.getitems([self.add_sub_path(k) for k in keys], **kwargs)
+        # The missing keys are omitted from the result, independently of the mapper used
+        sub_keys = {self.add_sub_path(k): k for k in keys}
+        if isinstance(self.mapper, BaseStore):
+            kwargs.setdefault("contexts", {})
+        elif isinstance(self.mapper, FSMap):
+            kwargs.setdefault("on_error", "omit")
+
+        with self.lock_keys(self.read_lock, keys):
+            if not hasattr(self.mapper, "getitems"):
+                return {
+                    key: self.mapper[sub_key]
+                    for sub_key, key in sub_keys.items()
+                    if sub_key in self.mapper
+                }
+            values = self.mapper.getitems(list(sub_keys), **kwargs)
+        return {sub_keys[k]: v for k, v in values.items()}
 
     def delitems(self, keys, **kwargs):
-        self.mapper.delitems(keys, **kwargs)
+        sub_keys = [self.add_sub_path(k) for k in keys]
+        with self.lock_keys(self.write_lock, keys):
+            if not hasattr(self.mapper, "delitems"):
+                for sub_key in sub_keys:
+                    del self.mapper[sub_key]
+                return
+            self.mapper.delitems(sub_keys, **kwargs)
+
+    def as_zarr_store(self) -> "MappingStore":
+        return MappingStore(self)
 
     def listdir(self, path=None):
         if hasattr(self.mapper, "listdir"):
@@ -126,14 +180,25 @@ class Mapping(MutableMapping):
         sub_map = self.mapper if path is None else self.sub_map(path)
         return list(sub_map)
 
-    def rmdir(self, path=None):
-        sub_map = self.mapper if path is None else self.sub_map(path)
-
-        total_keys = list(sub_map.keys())
-        if len(total_keys) == 0:
+    def rmdir(self, path=None, batch_size: int = 1000, max_workers: int = 8):
+        sub_map = self if path is None else self.sub_map(path)
+        if hasattr(sub_map.mapper, "fs"):
+            # A unique recursive delete, which allows to the file system to delete the whole prefix
+            # using bulk requests instead of listing and deleting the keys one by one
+            with contextlib.suppress(FileNotFoundError):
+                sub_map.mapper.fs.rm(sub_map.full_path(None), recursive=True)
             return
 
-        return sub_map.delitems(total_keys)
+        total_keys = list(sub_map.keys())
+        with ThreadPoolExecutor(max_workers) as executor:
+            batches = executor.map(
+                sub_map.delitems, mit.chunked(total_keys, batch_size)
+            )
+            for i, _ in enumerate(batches, 1):
+                logger.debug(
+                    f"Deleted {min(i * batch_size, len(total_keys))} of {len(total_keys)} "
+                    f"keys on {sub_map.full_path(None)}"
+                )
 
     def info(self, path):
         return self.mapper.fs.info(self.full_path(path))
@@ -141,6 +206,94 @@ class Mapping(MutableMapping):
     def checksum(self, key):
         return self.mapper.fs.checksum(self.full_path(key))
 
+    @staticmethod
+    def token_from_info(
+        info: dict, method: Literal["etag", "mtime"] = "etag"
+    ) -> Optional[str]:
+        # Cheap identifier of the version of a file based on the metadata of the file system,
+        # the etag method fallbacks to the modification time if the file system has no etags
+        names = ["mtime", "LastModified", "last_modified", "updated", "created"]
+        if method == "etag":
+            names = ["ETag", "etag", "md5Hash"] + names
+
+        for name in names:
+            if info.get(name) is not None:
+                return f"{info[name]}-{info.get('size')}"
+        return None
+
+    @staticmethod
+    def content_hash_from_info(info: dict) -> Optional[str]:
+        # Hash of the content of a file provided by the file system, unlike the modification time
+        # it only changes if the content changes
+        for name in ["ETag", "etag", "md5Hash", "checksum"]:
+            if info.get(name) is not None:
+                return str(info[name])
+        return None
+
+    def version_token(
+        self, key, method: Literal["etag", "mtime"] = "etag"
+    ) -> Optional[str]:
+        try:
+            return self.token_from_info(self.info(key), method)
+        except FileNotFoundError as e:
+            raise KeyError(key) from e
+
+    def version_tokens(
+        self, keys, method: Literal["etag", "mtime"] = "etag", max_workers: int = 16
+    ) -> dict[str, Optional[str]]:
+        # Tokens of multiple keys requesting their metadata concurrently, the missing keys are omitted
+        fs = self.mapper.fs
+        paths = {key: self.full_path(key) for key in keys}
+        if not paths:
+            return {}
+        if fs.async_impl:
+            infos = fsspec.asyn.sync(
+                fs.loop,
+                fsspec.asyn._run_coros_in_chunks,
+                [fs._info(path) for path in paths.values()],
+                return_exceptions=True,
+            )
+        else:
+
+            def info(path):
+                try:
+                    return fs.info(path)
+                except FileNotFoundError as e:
+                    return e
+
+            with ThreadPoolExecutor(min(max_workers, len(paths))) as executor:
+                infos = list(executor.map(info, paths.values()))
+
+        tokens = {}
+        for key, info in zip(paths, infos, strict=True):
+            if isinstance(info, FileNotFoundError):
+                continue
+            if isinstance(info, Exception):
+                raise info
+            tokens[key] = self.token_from_info(info, method)
+        return tokens
+
+    def list_info(self, path=None) -> dict[str, dict]:
+        # Details of every file inside the path using a unique listing of the file system,
+        # the keys are relative to the path
+        sub_map = self if path is None else self.sub_map(path)
+        if not hasattr(sub_map.mapper, "fs"):
+            return {
+                key: {"size": len(value), "ETag": hashlib.md5(value).hexdigest()}
+                for key, value in ((key, sub_map[key]) for key in sub_map.keys())
+            }
+
+        fs = sub_map.mapper.fs
+        root = fs._strip_protocol(sub_map.full_path(None)).rstrip("/")
+        try:
+            files = fs.find(root, detail=True)
+        except FileNotFoundError:
+            return {}
+        return {
+            fs._strip_protocol(name)[len(root) + 1 :]: info
+            for name, info in files.items()
+        }
+
     def equal_content(
         self, other, path, method: Literal["checksum", "content"] = "checksum"
     ):
@@ -154,6 +307,15 @@ class Mapping(MutableMapping):
 
         return False
 
+    def list_tokens(self, path=None) -> dict[str, Optional[str]]:
+        # Token of the content of every key inside the path using a unique listing
+        return {
+            key: self.token_from_info(info)
+            for key, info in self.list_info(path).items()
+        }
+
+    manifest_key = ".zmanifest"
+
     @staticmethod
     def synchronize(
         remote_map: "Mapping",
@@ -161,72 +323,220 @@ class Mapping(MutableMapping):
         checksum_map: "Mapping",
         to_local: bool,
         force: bool = False,
+        max_workers: int = 16,
     ):
-        remote_paths = set(list(remote_map.keys()))
-        local_paths = set(list(local_map.keys()))
-        total_paths = list(remote_paths | local_paths)
+        # The checksum_map keeps a manifest with the tokens (etag or modification time and size) that
+        # every key had on both mappings after the last synchronization, so only a listing of every
+        # mapping is necessary to find the keys that were modified on any of them
+        manifest = {}
+        if not force and Mapping.manifest_key in checksum_map:
+            manifest = orjson.loads(checksum_map[Mapping.manifest_key])
+
+        source_name, destination_name = "local", "remote"
+        source_map, destination_map = local_map, remote_map
+        if to_local:
+            source_name, destination_name = "remote", "local"
+            source_map, destination_map = remote_map, local_map
+
+        source_tokens = source_map.list_tokens()
+        destination_tokens = destination_map.list_tokens()
+
+        copy_paths = [
+            path
+            for path, token in source_tokens.items()
+            if path not in destination_tokens
+            or manifest.get(path, {}).get(source_name) != token
+            or manifest.get(path, {}).get(destination_name) != destination_tokens[path]
+        ]
+        delete_paths = [
+            path for path in destination_tokens if path not in source_tokens
+        ]
 
         def _move_data(path):
-            if to_local:
-                if path in local_paths and path not in remote_paths:
-                    del local_map[path]
-                    if path in checksum_map:
-                        del local_map[path]
-                    return
-
-                remote_checksum = str(remote_map.checksum(path))
-                if not force and path in checksum_map:
-                    local_checksum = checksum_map[path].decode()
-                    if local_checksum == remote_checksum:
-                        return
-
-                local_map[path] = remote_map[path]
-                checksum_map[path] = remote_checksum.encode()
-            else:
-                if path in remote_paths and path not in local_paths:
-                    del remote_paths[path]
-                    return
-
-                if not force and path in checksum_map:
-                    remote_checksum = str(remote_map.checksum(path))
-                    local_checksum = checksum_map[path].decode()
-                    if local_checksum == remote_checksum:
-                        return
-
-                remote_map[path] = local_map[path]
-
-        with ThreadPoolExecutor(os.cpu_count()) as p:
-            list(p.map(_move_data, total_paths))
+            destination_map[path] = source_map[path]
+
+        with ThreadPoolExecutor(max_workers) as p:
+            list(p.map(_move_data, copy_paths))
+        if delete_paths:
+            destination_map.delitems(delete_paths)
+
+        if copy_paths:
+            destination_tokens = destination_map.list_tokens()
+        elif not delete_paths and manifest.keys() == source_tokens.keys():
+            return
+        checksum_map[Mapping.manifest_key] = orjson.dumps(
+            {
+                path: {
+                    source_name: token,
+                    destination_name: destination_tokens.get(path),
+                }
+                for path, token in source_tokens.items()
+            }
+        )
+
+    @staticmethod
+    def _modification_time(info: dict) -> Optional[pd.Timestamp]:
+        for name in ["mtime", "LastModified", "last_modified", "updated"]:
+            value = info.get(name)
+            if value is None:
+                continue
+            if isinstance(value, (int, float)):
+                return pd.Timestamp(value, unit="s", tz="UTC")
+            value = pd.Timestamp(value)
+            return value.tz_localize("UTC") if value.tz is None else value
+        return None
+
+    @classmethod
+    def equal_info(cls, info: dict, other_info: Optional[dict]) -> Optional[bool]:
+        # Compare two files using only their details, None means that it is not possible to know
+        # if they are equal. Only the etag or checksum can prove that they are equal, the modification time
+        # only proves that the first file changed if the other one was modified before it
+        if other_info is None or info.get("size") != other_info.get("size"):
+            return False
+        for name in ["ETag", "etag", "md5Hash", "checksum"]:
+            if info.get(name) is not None and other_info.get(name) is not None:
+                return info[name] == other_info[name]
+        modification_time = cls._modification_time(info)
+        other_modification_time = cls._modification_time(other_info)
+        if modification_time is not None and other_modification_time is not None:
+            if other_modification_time < modification_time:
+                return False
+        return None
+
+    def invalidate(self, key):
+        # Drop any state kept for the key, it is called after writing it directly on the file system
+        pass
+
+    def _async_fs(self, lock: PrefixLock):
+        # The async methods of the file system are only used if there are no locks to take
+        fs = getattr(self.mapper, "fs", None)
+        if fs is None or not fs.async_impl:
+            return None
+        if not isinstance(lock, PrefixLock) or lock.lock is not NoLock:
+            return None
+        return fs
 
     def folders_synchronize(
         self,
-        destination,
-        folders,
-        comparing_method: Literal["checksum", "content"],
-        n_threads,
-    ):
-        source_paths = [file for folder in folders for file in self.listdir(folder)]
-        destination_paths = [
-            file for folder in folders for file in destination.listdir(folder)
-        ]
-        delete_paths = sorted(set(destination_paths) - set(source_paths))
+        destination: "Mapping",
+        folders: list[str],
+        comparing_method: Literal["checksum", "content"] = "checksum",
+        n_threads: int = 16,
+        max_inflight_bytes: int = 2**28,
+    ) -> list[str]:
+        # Copy the files of the folders to the destination and delete the ones that are not on the source.
+        # The listing, comparison and copy of every folder are pipelined on the event loop of fsspec, the
+        # files are compared using their size and etag, the modification time can only detect changes, and if
+        # it is not conclusive the comparing_method is used. The async file systems are used directly, and the
+        # rest through threads, the writes made directly on the file system invalidate the keys of the destination
+        return fsspec.asyn.sync(
+            fsspec.asyn.get_loop(),
+            self._folders_synchronize,
+            destination=destination,
+            folders=folders,
+            comparing_method=comparing_method,
+            n_threads=n_threads,
+            max_inflight_bytes=max_inflight_bytes,
+        )
 
-        def copy_file(path):
-            if path in destination and self.equal_content(
-                destination, path, comparing_method
-            ):
+    async def _folders_synchronize(
+        self,
+        destination: "Mapping",
+        folders: list[str],
+        comparing_method: Literal["checksum", "content"],
+        n_threads: int,
+        max_inflight_bytes: int,
+    ) -> list[str]:
+        semaphore = asyncio.Semaphore(n_threads)
+        condition = asyncio.Condition()
+        inflight_bytes = 0
+        source_fs = self._async_fs(self.read_lock)
+        destination_fs = destination._async_fs(destination.write_lock)
+
+        async def run(func, *args):
+            async with semaphore:
+                return await asyncio.to_thread(func, *args)
+
+        async def copy_file(path, info, destination_info):
+            nonlocal inflight_bytes
+            equal = self.equal_info(info, destination_info)
+            if equal is None:
+                equal = await run(
+                    self.equal_content, destination, path, comparing_method
+                )
+            if equal:
                 return None
-            destination[path] = self[path]
+
+            # Limit the number of bytes that are in memory, a file bigger than the limit is copied alone
+            size = info.get("size") or 0
+            async with condition:
+                await condition.wait_for(
+                    lambda: (
+                        inflight_bytes == 0
+                        or inflight_bytes + size <= max_inflight_bytes
+                    )
+                )
+                inflight_bytes += size
+            try:
+                async with semaphore:
+                    if source_fs is None:
+                        value = await asyncio.to_thread(self.__getitem__, path)
+                    else:
+                        value = await source_fs._cat_file(self.full_path(path))
+                    if destination_fs is None:
+                        await asyncio.to_thread(destination.__setitem__, path, value)
+                    else:
+                        await destination_fs._pipe_file(
+                            destination.full_path(path), value
+                        )
+                        destination.invalidate(path)
+            finally:
+                async with condition:
+                    inflight_bytes -= size
+                    condition.notify_all()
             return path
 
-        def del_file(path):
-            del destination[path]
+        async def delete_file(path):
+            async with semaphore:
+                if destination_fs is None:
+                    await asyncio.to_thread(destination.__delitem__, path)
+                else:
+                    await destination_fs._rm_file(destination.full_path(path))
+                    destination.invalidate(path)
+            return path
 
-        modified_files = list(delete_paths)
-        with ThreadPoolExecutor(n_threads) as p:
-            modified_files.extend(
-                [path for path in p.map(copy_file, source_paths) if path is not None]
+        async def synchronize_folder(folder):
+            source_info, destination_info = await asyncio.gather(
+                run(self.list_info, folder), run(destination.list_info, folder)
             )
-            list(p.map(del_file, delete_paths))
+            source_info = {f"{folder}/{k}": v for k, v in source_info.items()}
+            destination_info = {f"{folder}/{k}": v for k, v in destination_info.items()}
+            delete_paths = sorted(set(destination_info) - set(source_info))
+            deleted, copied = await asyncio.gather(
+                asyncio.gather(*[delete_file(path) for path in delete_paths]),
+                asyncio.gather(
+                    *[
+                        copy_file(path, info, destination_info.get(path))
+                        for path, info in source_info.items()
+                    ]
+                ),
+            )
+            return list(deleted), [path for path in copied if path is not None]
 
+        results = await asyncio.gather(*[synchronize_folder(f) for f in folders])
+        modified_files = [path for deleted, _ in results for path in deleted]
+        modified_files.extend(path for _, copied in results for path in copied)
         return modified_files
+
+
+class MappingStore(KVStore):
+    # Zarr wraps any MutableMapping on a KVStore which reads and writes the chunks one by one,
+    # this store sends the groups of chunks to the bulk methods of the Mapping, which take the locks
+    def getitems(self, keys, *, contexts):
+        return self._mutable_mapping.getitems(keys)
+
+    def setitems(self, values):
+        self._mutable_mapping.setitems(values)
+
+    def delitems(self, keys):
+        self._mutable_mapping.delitems(keys)
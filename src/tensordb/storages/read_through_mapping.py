@@ -0,0 +1,83 @@
+from collections.abc import MutableMapping
+
+from tensordb.storages.lock import PrefixLock
+from tensordb.storages.mapping import Mapping
+
+
+class ReadThroughMapping(Mapping):
+    """
+    Mapping that reads the keys from its mapper, and the keys that are not there are read from the
+    remote_map and then written on the mapper, so the next reads are local.
+    The writes and deletes are only applied on the mapper.
+
+    Parameters
+    ----------
+
+    remote_map: Mapping
+        Mapping used to read the keys that do not exist on the mapper
+    """
+
+    def __init__(
+        self,
+        mapper: MutableMapping,
+        remote_map: Mapping,
+        sub_path: str = None,
+        read_lock: PrefixLock = None,
+        write_lock: PrefixLock = None,
+        root: str = None,
+        enable_sub_map: bool = True,
+    ):
+        super().__init__(
+            mapper=mapper,
+            sub_path=sub_path,
+            read_lock=read_lock,
+            write_lock=write_lock,
+            root=root,
+            enable_sub_map=enable_sub_map,
+        )
+        self.remote_map = remote_map
+
+    @classmethod
+    def from_mapping(
+        cls, mapping: Mapping, remote_map: Mapping
+    ) -> "ReadThroughMapping":
+        return cls(
+            mapper=mapping.mapper,
+            remote_map=remote_map,
+            sub_path=mapping.sub_path,
+            read_lock=mapping.read_lock,
+            write_lock=mapping.write_lock,
+            root=mapping._root,
+            enable_sub_map=mapping.enable_sub_map,
+        )
+
+    def sub_map(self, sub_path):
+        return self.from_mapping(
+            super().sub_map(sub_path), remote_map=self.remote_map.sub_map(sub_path)
+        )
+
+    def __getitem__(self, key):
+        try:
+            return super().__getitem__(key)
+        except KeyError:
+            pass
+        value = self.remote_map[key]
+        super().__setitem__(key, value)
+        return value
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self.remote_map
+
+    def getitems(self, keys, **kwargs):
+        if not keys:
+            return {}
+        values = super().getitems(keys, **kwargs)
+        missing_keys = [key for key in keys if key not in values]
+        if not missing_keys:
+            return values
+
+        remote_values = self.remote_map.getitems(missing_keys)
+        for key, value in remote_values.items():
+            super().__setitem__(key, value)
+        values.update(remote_values)
+        return values
@@ -1,15 +1,31 @@
+import contextlib
+import functools
+import hashlib
+import io
+import itertools
+import threading
+import time
+import uuid
 from collections.abc import Hashable
-from typing import Any, Literal, Union
+from typing import Any, Literal, Optional, Union
 
+import dask
+import more_itertools as mit
 import numpy as np
+import orjson
 import xarray as xr
 import zarr
+from dask.delayed import Delayed
 
 from tensordb.algorithms import Algorithms
 from tensordb.storages.base_storage import BaseStorage
+from tensordb.storages.layered_mapping import LayeredMapping
 from tensordb.storages.lock import PrefixLock
 from tensordb.storages.mapping import Mapping
 
+# Serialize the modifications of the version pointers made by the threads of the process
+_pointer_lock = threading.Lock()
+
 
 class ZarrStorage(BaseStorage):
     """
@@ -33,6 +49,53 @@ class ZarrStorage(BaseStorage):
         If less or equal dimensions than this number needs to be sorted then create a unique
         chunk along the dimension to avoid generating many small chunks that can generate memory issues
 
+    cache_dataset: bool, default False
+        Keep the dataset opened by the read method in memory, so the consolidated metadata and the
+        coordinates are only loaded once while the tensor is not modified. The cache is invalidated
+        after every write made through the storage, and if the base_map exposes an fsspec file system
+        it is also validated against the etag or modification time of the consolidated metadata,
+        which allows to detect modifications made by other processes.
+
+    max_rewrite_chunks: int, default 4
+        Maximum number of chunks along a dimension that can be rewritten to insert data in the middle
+        of the tensor or to drop coords that are not at the end, only the chunks after the first
+        inserted or dropped coord are rewritten and the data of those chunks is loaded in memory.
+        If more chunks must be rewritten, or if the order is violated on more than one dimension,
+        then the whole tensor is rewritten. Use 0 to always rewrite the whole tensor.
+
+    versioned: bool, default False
+        Store every complete write of the tensor (store method or rewrites) in a new version folder and then
+        replace the pointer file that indicates the current version, so the tensor is written only once and
+        the readers never see an empty or partially written tensor. The rest of the writes
+        (append, update, drop) modify the current version in place.
+
+    keep_versions: int, default 2
+        Number of versions kept when the versioned option is enabled, the oldest versions are deleted
+        after changing the pointer, keeping more than one version allows the readers that opened
+        the previous version to finish.
+
+    max_layers: int, default 4
+        Maximum number of layers that the actual version can stack over the versions of the snapshots,
+        every read looks for the keys layer by layer, so when a snapshot or a restoration exceeds it
+        all the keys are copied on a new version with a unique layer (read the snapshot method).
+
+    update_mode: Literal["region", "chunks"], default "region"
+        Strategy used by the update method, "region" writes a unique contiguous region that contains
+        all the coords to update, which can rewrite many chunks that are not modified, and "chunks"
+        writes one region per group of adjacent chunks that contains cells to update,
+        so the cost of the update only depends on the number of chunks modified.
+
+    append_log: bool, default False
+        Write every append of an existing tensor as a small delta file on a log located inside the tensor
+        (a write ahead log), instead of modifying the Zarr arrays, the read method applies the deltas
+        of the log over the stored data, so the appends are visible immediately.
+        The log is folded into the Zarr arrays using the compact method, which is also called
+        before any update or drop, and it is discarded when the tensor is stored again.
+
+    max_append_log: int, default 64
+        Number of deltas on the log that triggers an automatic compaction after an append,
+        use 0 to only compact the log explicitly.
+
     TODO:
         1. Add more examples to the documentation
 
@@ -49,6 +112,14 @@ class ZarrStorage(BaseStorage):
         synchronize_only_write: bool = False,
         default_unique_coord: bool = True,
         max_unsort_dims_to_rechunk: int = 1,
+        cache_dataset: bool = False,
+        max_rewrite_chunks: int = 4,
+        versioned: bool = False,
+        keep_versions: int = 2,
+        max_layers: int = 4,
+        update_mode: Literal["region", "chunks"] = "region",
+        append_log: bool = False,
+        max_append_log: int = 64,
         **kwargs,
     ):
         super().__init__(tmp_map=tmp_map, **kwargs)
@@ -74,6 +145,16 @@ class ZarrStorage(BaseStorage):
         self.synchronize_only_write = synchronize_only_write
         self.default_unique_coord = default_unique_coord
         self.max_unsort_dims_to_rechunk = max_unsort_dims_to_rechunk
+        self.cache_dataset = cache_dataset
+        self._dataset_cache = None
+        self.update_mode = update_mode
+        self.max_rewrite_chunks = max_rewrite_chunks
+        self.versioned = versioned
+        self.keep_versions = keep_versions
+        self.max_layers = max_layers
+        self.append_log = append_log
+        self.max_append_log = max_append_log
+        self._append_log_cache = {}
 
     def _keep_unique_coords(self, new_data):
         new_data = new_data.sel(
@@ -169,7 +250,42 @@ class ZarrStorage(BaseStorage):
             (or at the beginning)
 
         """
-        act_data = self.read()
+        act_data, data_to_append, rewrite = self._plan_append(
+            new_data=new_data, fill_value=fill_value
+        )
+        complete_data = self._complete_append(
+            act_data=act_data,
+            data_to_append=data_to_append,
+            fill_value=fill_value,
+            rewrite=rewrite,
+        )
+        if rewrite:
+            # Not necessary, return an empty dict to avoid confusion
+            data_to_append = {}
+
+        return complete_data, data_to_append, rewrite
+
+    @staticmethod
+    def _regular_chunks(size: int, chunk: int, offset: int = 0) -> tuple[int, ...]:
+        # Chunks that a slice starting at the offset position must have to be aligned with
+        # a Zarr array whose chunk size is the one sent
+        chunks = []
+        first_chunk = min(-offset % chunk, size)
+        if first_chunk:
+            chunks.append(first_chunk)
+        size -= first_chunk
+        chunks.extend([chunk] * (size // chunk))
+        if size % chunk:
+            chunks.append(size % chunk)
+        return tuple(chunks)
+
+    def _plan_append(
+        self, new_data: xr.Dataset, fill_value
+    ) -> tuple[xr.Dataset, dict[str | Hashable, xr.Dataset], bool]:
+        # Generates the data that must be appended on every dimension with chunks aligned to the
+        # Zarr arrays, the chunks are calculated using only the shape and chunks of the stored arrays,
+        # so the graph generated only depends on the size of the new data
+        act_data = self._read_stored()
         self._validate_new_data(act_data, new_data)
         act_data = self._transform_to_dataset(act_data, chunk_data=False)
         new_data = self._keep_unique_coords(new_data)
@@ -182,15 +298,11 @@ class ZarrStorage(BaseStorage):
 
         # Decide if the data needs to be restored due to insertions in the middle
         rewrite = False
-        # The data stored here are the new datasets must be rechunked to be aligned
-        # with the chunks of the data already stored.
         # Note: The order of insertion is defined by the dims of the data
         data_to_append = {}
-        # The slices are used to calculate the correct chunks to align the data_to_append chunks
-        slices_to_append = {}
-        # The complete_data is a representation of the final array after concatenating the data_to_append
-        # to the act_data, and it is also used to calculate the proper chunks for the data_to_append
-        complete_data = act_data
+        # Coords and sizes of the data after appending the data of the previous dims
+        complete_coords = {dim: act_data.indexes[dim] for dim in dims}
+        complete_sizes = dict(act_data.sizes)
 
         preferred_chunks = act_data[list(act_data.keys())[0]].encoding[
             "preferred_chunks"
@@ -212,28 +324,53 @@ class ZarrStorage(BaseStorage):
                 current_coord=act_coord, append_coord=coord_to_append, dim=dim
             )
 
-            slices_to_append[dim] = {
-                k: slice(size, None) if k == dim else slice(0, size)
-                for k, size in complete_data.sizes.items()
-            }
-
             reindex_coords = {
-                k: coord_to_append if k == dim else act_coord
-                for k, act_coord in complete_data.coords.items()
+                k: coord_to_append if k == dim else coord
+                for k, coord in complete_coords.items()
             }
 
-            # Reindex the new_data to align it with the complete_data
-            data_to_append[dim] = Algorithms.reindex_with_pad(
+            # Reindex the new_data to align it with the complete data
+            data = Algorithms.reindex_with_pad(
                 data=new_data,
                 coords=reindex_coords,
                 preferred_chunks=preferred_chunks,
                 fill_value=fill_value,
             )
 
-            # Append the data in a delayed way to simulate the appending of the data
-            # and generate the proper chunks to match with Zarr
+            # The data is appended at the end of the dim, so the first chunk must fill
+            # the last chunk of the stored array, and the rest of dims start from zero
+            data_to_append[dim] = data.chunk(
+                {
+                    k: self._regular_chunks(
+                        size=len(coord),
+                        chunk=preferred_chunks.get(k, complete_sizes[k] + len(coord)),
+                        offset=complete_sizes[k] if k == dim else 0,
+                    )
+                    for k, coord in reindex_coords.items()
+                }
+            )
+
+            complete_coords[dim] = complete_coords[dim].append(coord_to_append)
+            complete_sizes[dim] += len(coord_to_append)
+
+        return act_data, data_to_append, rewrite
+
+    def _complete_append(
+        self,
+        act_data: xr.Dataset,
+        data_to_append: dict[str | Hashable, xr.Dataset],
+        fill_value,
+        rewrite: bool,
+    ) -> xr.Dataset:
+        # Append the data in a delayed way to simulate the appending of the data,
+        # the graph generated depends on the size of the whole tensor
+        preferred_chunks = act_data[list(act_data.keys())[0]].encoding[
+            "preferred_chunks"
+        ]
+        complete_data = act_data
+        for dim, data in data_to_append.items():
             complete_data = xr.concat(
-                [complete_data, data_to_append[dim]], dim=dim, fill_value=fill_value
+                [complete_data, data], dim=dim, fill_value=fill_value
             )
 
         # Rechunk the complete_data to make it consistent with the Zarr chunks
@@ -250,19 +387,155 @@ class ZarrStorage(BaseStorage):
             complete_data = self._keep_unique_coords(complete_data)
             complete_data = self._keep_sorted_coords(complete_data)
             complete_data = self._transform_to_dataset(complete_data)
-            # Not necessary, return an empty dict to avoid confusion
-            data_to_append = {}
-        else:
-            # Rechunk the data_to_append in the dim order based on the chunks of the complete_data
-            # after slicing it, this is to avoid calculating the correct chunks by hand.
-            data_to_append = {
-                dim: data_to_append[dim].chunk(
-                    complete_data.isel(**slices_to_append[dim]).chunksizes
+
+        return complete_data
+
+    def _insert_in_the_middle(
+        self, new_data: Union[xr.DataArray, xr.Dataset], compute: bool, fill_value
+    ) -> Optional[list[xr.backends.ZarrStore]]:
+        # Insert the data rewriting only the chunks that are after the first inserted coord
+        # on the dimension whose order is violated, the rest of dimensions are appended normally.
+        # None is returned if it is not possible, and the whole tensor must be rewritten.
+        # The insertion is always eager because the tail must be read before overwriting it,
+        # so the delayed writes (compute=False) use the rewrite
+        if not self.max_rewrite_chunks or not compute:
+            return None
+
+        act_data = self._transform_to_dataset(self._read_stored(), chunk_data=False)
+        new_data = self._keep_unique_coords(new_data)
+        new_data = self._keep_sorted_coords(new_data)
+        new_data = self._transform_to_dataset(new_data, chunk_data=False)
+        self.clear_encoding(new_data)
+
+        dims = act_data[list(act_data.keys())[0]].dims
+        preferred_chunks = act_data[list(act_data.keys())[0]].encoding[
+            "preferred_chunks"
+        ]
+        coords_to_append = {
+            dim: new_data.indexes[dim][
+                ~new_data.indexes[dim].isin(act_data.indexes[dim])
+            ]
+            for dim in dims
+        }
+        insert_dims = [
+            dim
+            for dim, coord in coords_to_append.items()
+            if len(coord)
+            and not self._validate_sorted_append(act_data.indexes[dim], coord, dim)
+        ]
+        if len(insert_dims) != 1:
+            return None
+
+        dim = insert_dims[0]
+        act_size = act_data.sizes[dim]
+        chunk = preferred_chunks.get(dim, act_size)
+        complete_coord = (
+            act_data.indexes[dim]
+            .append(coords_to_append[dim])
+            .sort_values(ascending=self.sorted_coords[dim])
+        )
+        start = complete_coord.get_indexer(coords_to_append[dim]).min()
+        start = start // chunk * chunk
+        if -(-(len(complete_coord) - start) // chunk) > self.max_rewrite_chunks:
+            return None
+
+        delayed_writes = []
+        if any(len(coords_to_append[k]) for k in dims if k != dim):
+            # Append the data of the other dims, so only the insertion on the dim is pending
+            delayed_writes.extend(
+                self._append_stored(
+                    new_data.reindex(
+                        {dim: act_data.indexes[dim]}, fill_value=fill_value
+                    ),
+                    compute=True,
+                    fill_value=fill_value,
                 )
-                for dim, data in data_to_append.items()
+            )
+            act_data = self._transform_to_dataset(self._read_stored(), chunk_data=False)
+
+        new_data = new_data.reindex(
+            {
+                k: coords_to_append[dim] if k == dim else act_data.indexes[k]
+                for k in dims
+            },
+            fill_value=fill_value,
+        )
+        # The tail must be loaded in memory because the same chunks are going to be overwritten
+        original_data = act_data.isel({dim: slice(start, None)}).load()
+        tail_data = xr.concat([original_data, new_data], dim=dim, fill_value=fill_value)
+        tail_data = tail_data.sel({dim: complete_coord[start:]})
+        delayed_writes.append(
+            self._shift_tail(
+                data_map=self.data_map,
+                tail_data=self._chunk_tail(tail_data, preferred_chunks, dim, start),
+                original_data=self._chunk_tail(
+                    original_data, preferred_chunks, dim, start
+                ),
+                dim=dim,
+                start=start,
+            )
+        )
+        return delayed_writes
+
+    def _chunk_tail(
+        self, data: xr.Dataset, preferred_chunks: dict, dim: str, start: int
+    ) -> xr.Dataset:
+        # Chunk the data that starts on the position start of the dim to align it with the Zarr chunks
+        data = data.chunk(
+            {
+                k: self._regular_chunks(
+                    size=data.sizes[k],
+                    chunk=preferred_chunks.get(k, data.sizes[k]),
+                    offset=start if k == dim else 0,
+                )
+                for k in data.dims
             }
+        )
+        self.clear_encoding(data)
+        return data
+
+    def _write_region(
+        self, data_map: Mapping, data: xr.Dataset, dim: str, start: int
+    ) -> xr.backends.ZarrStore:
+        # The coord is not an index to allow Xarray to write it on the region
+        return data.drop_indexes(dim).to_zarr(
+            data_map.as_zarr_store(),
+            compute=True,
+            synchronizer=self.synchronizer,
+            group=self.group,
+            region={
+                k: slice(start, start + size) if k == dim else slice(0, size)
+                for k, size in data.sizes.items()
+            },
+            safe_chunks=False,
+        )
 
-        return complete_data, data_to_append, rewrite
+    def _shift_tail(
+        self,
+        data_map: Mapping,
+        tail_data: xr.Dataset,
+        original_data: xr.Dataset,
+        dim: str,
+        start: int,
+    ) -> xr.backends.ZarrStore:
+        # Replace the original data that starts on the position start of the dim by the tail,
+        # resizing the arrays to fit it. Both are loaded in memory, so if any write fails the original
+        # size and data are restored, and a partial write never leaves corrupted cells
+        size = start + original_data.sizes[dim]
+        new_size = start + tail_data.sizes[dim]
+        try:
+            if new_size > size:
+                self._resize(data_map, dim, new_size)
+            delayed_write = self._write_region(data_map, tail_data, dim, start)
+            if new_size < size:
+                self._resize(data_map, dim, new_size)
+        except Exception:
+            self._resize(data_map, dim, size)
+            self._write_region(data_map, original_data, dim, start)
+            raise
+        finally:
+            self._dataset_cache = None
+        return delayed_write
 
     def update_preview(
         self,
@@ -283,7 +556,79 @@ class ZarrStorage(BaseStorage):
 
         2. regions: Region at which the update_data must be inserted in the Zarr store.
         """
-        act_data = self.read()
+        act_data, new_data = self._prepare_update(
+            new_data=new_data,
+            complete_update_dims=complete_update_dims,
+            fill_value=fill_value,
+        )
+        if act_data is None:
+            return xr.Dataset(), {}
+
+        positions = self._update_positions(act_data, new_data)
+        regions = {
+            dim: slice(np.min(valid_positions), np.max(valid_positions) + 1)
+            for dim, valid_positions in positions.items()
+        }
+        update_data = self._region_update_data(act_data, new_data, regions, fill_value)
+        return update_data, regions
+
+    def update_chunks_preview(
+        self,
+        new_data: xr.Dataset,
+        complete_update_dims: str | list[str] | None,
+        fill_value: Any,
+    ) -> list[tuple[xr.Dataset, dict[str, slice]]]:
+        """
+        Equivalent to the update_preview method but instead of generating a unique contiguous region
+        it generates one region per group of adjacent chunks that contains cells to update,
+        so the chunks without modifications are never read or written.
+
+        Returns
+        -------
+
+        A list of tuples with the update_data and regions, every element has the same
+        meaning that the output of the update_preview method.
+        """
+        act_data, new_data = self._prepare_update(
+            new_data=new_data,
+            complete_update_dims=complete_update_dims,
+            fill_value=fill_value,
+        )
+        if act_data is None:
+            return []
+
+        preferred_chunks = act_data[list(act_data.keys())[0]].encoding[
+            "preferred_chunks"
+        ]
+        runs = {}
+        for dim, valid_positions in self._update_positions(act_data, new_data).items():
+            chunk = preferred_chunks.get(dim, act_data.sizes[dim])
+            # Group the positions on runs of adjacent chunks, and limit every run to
+            # the positions that are going to be updated
+            chunk_ids = valid_positions // chunk
+            splits = np.nonzero(np.diff(chunk_ids) > 1)[0] + 1
+            runs[dim] = [
+                slice(run[0], run[-1] + 1) for run in np.split(valid_positions, splits)
+            ]
+
+        return [
+            (
+                self._region_update_data(act_data, new_data, regions, fill_value),
+                regions,
+            )
+            for regions in (
+                dict(zip(runs.keys(), run_regions, strict=True))
+                for run_regions in itertools.product(*runs.values())
+            )
+        ]
+
+    def _prepare_update(
+        self,
+        new_data: xr.Dataset,
+        complete_update_dims: str | list[str] | None,
+        fill_value: Any,
+    ) -> tuple[xr.Dataset | None, xr.Dataset | None]:
+        act_data = self._read_stored()
         self._validate_new_data(act_data, new_data)
         act_data = self._transform_to_dataset(act_data, chunk_data=False)
         new_data = self._transform_to_dataset(new_data, chunk_data=False)
@@ -291,9 +636,6 @@ class ZarrStorage(BaseStorage):
         new_data = self._keep_sorted_coords(new_data)
         self.clear_encoding(new_data)
 
-        # Force to always use the same dimension order
-        dims = act_data[list(act_data.keys())[0]].dims
-
         act_coords = {k: coord for k, coord in act_data.coords.items()}
 
         # The new data must contain only coordinates that are on the act_coords
@@ -301,7 +643,7 @@ class ZarrStorage(BaseStorage):
             {k: new_data.coords[k].isin(v) for k, v in act_coords.items()}
         )
         if any(size == 0 for size in new_data.sizes.values()):
-            return xr.Dataset(), {}
+            return None, None
 
         if complete_update_dims is not None:
             if isinstance(complete_update_dims, str):
@@ -316,15 +658,28 @@ class ZarrStorage(BaseStorage):
                 fill_value=fill_value,
             )
 
-        regions = {}
-        for coord_name in dims:
-            act_bitmask = act_coords[coord_name].isin(
-                new_data.coords[coord_name].values
-            )
-            valid_positions = np.nonzero(act_bitmask.values)[0]
-            regions[coord_name] = slice(
-                np.min(valid_positions), np.max(valid_positions) + 1
-            )
+        return act_data, new_data
+
+    @staticmethod
+    def _update_positions(
+        act_data: xr.Dataset, new_data: xr.Dataset
+    ) -> dict[str, np.ndarray]:
+        # Positions of the coords of the new_data on the act_data, sorted and in the dims order
+        dims = act_data[list(act_data.keys())[0]].dims
+        return {
+            dim: np.nonzero(act_data.indexes[dim].isin(new_data.coords[dim].values))[0]
+            for dim in dims
+        }
+
+    @staticmethod
+    def _region_update_data(
+        act_data: xr.Dataset,
+        new_data: xr.Dataset,
+        regions: dict[str, slice],
+        fill_value: Any,
+    ) -> xr.Dataset:
+        # Force to always use the same dimension order
+        dims = act_data[list(act_data.keys())[0]].dims
 
         act_data_region = act_data.isel(**regions)
 
@@ -354,7 +709,7 @@ class ZarrStorage(BaseStorage):
         # Only update the corresponding cells
         update_data = new_data.where(bitmask_arr, act_data_region)
 
-        return update_data, regions
+        return update_data
 
     @staticmethod
     def clear_encoding(dataset):
@@ -389,7 +744,7 @@ class ZarrStorage(BaseStorage):
         rewrite: bool, default False
             If it is True, it allows to overwrite the tensor using its own data, this can be inefficient due that
             first it has to store the tensor on a temporal location to then write it on the original and delete
-            the temporal.
+            the temporal. If the versioned option is enabled the data is written directly on a new version.
             The compute option is always set as True if the rewrite option is active
 
         on_tmp: bool, default False
@@ -409,38 +764,281 @@ class ZarrStorage(BaseStorage):
 
         self.clear_encoding(new_data)
 
+        if self.append_log and not rewrite and not on_tmp:
+            # The pending appends belong to the data that is going to be replaced
+            self._delete_append_log(self._append_log_keys())
+
+        if self.versioned and not on_tmp:
+            # The previous version is not modified, so it is safe to read it while the new one is written
+            return self._store_version(new_data, compute=compute or rewrite)
+
         if rewrite or on_tmp:
             compute = True
             new_data.to_zarr(
-                self.tmp_map,
+                self.tmp_map.as_zarr_store(),
                 mode="w",
                 compute=compute,
                 consolidated=True,
                 encoding=self.encoding,
             )
             new_data = xr.open_zarr(
-                self.tmp_map,
+                self.tmp_map.as_zarr_store(),
                 consolidated=True,
             )
             if on_tmp:
                 return new_data[self.data_names]
 
-        self.delete_tensor()
+        keep_log = self._delete_stored()
 
         delayed_write = new_data.to_zarr(
-            self.base_map,
-            mode="w",
+            self.base_map.as_zarr_store(),
+            # The "w" mode deletes all the keys of the store, including the append log
+            mode="w-" if keep_log else "w",
             compute=compute,
             consolidated=True,
             group=self.group,
             encoding=self.encoding,
         )
+        self._dataset_cache = None
 
         if rewrite:
             self.tmp_map.rmdir()
 
         return delayed_write
 
+    def _store_version(
+        self, new_data: xr.Dataset, compute: bool
+    ) -> Union[xr.backends.ZarrStore, Delayed]:
+        version = self._allocate_version()
+        data_map = self._layer_map(version)
+        # Clean any leftover of a failed write of the same version
+        data_map.rmdir()
+        delayed_write = new_data.to_zarr(
+            data_map.as_zarr_store(),
+            mode="w",
+            compute=compute,
+            consolidated=True,
+            group=self.group,
+            encoding=self.encoding,
+        )
+        if not compute:
+            # The pointer can only be changed after writing the data
+            return dask.delayed(self._set_version)(version, delayed_write)
+
+        self._set_version(version)
+        return delayed_write
+
+    def _pointer_write_lock(self):
+        lock = self.base_map.write_lock[
+            self.base_map.add_lock_path(f"{self.version_key}.lock")
+        ]
+        stack = contextlib.ExitStack()
+        stack.enter_context(_pointer_lock)
+        stack.enter_context(lock)
+        return stack
+
+    def _allocate_version(self) -> int:
+        # Reserve a version that was never used, the actual version is not modified until the data
+        # is written, so the concurrent and delayed writes can not use the same version
+        with self._pointer_write_lock():
+            pointer = self._read_pointer()
+            version = 0 if pointer is None else pointer["version"] + 1
+            with contextlib.suppress(KeyError):
+                version = max(version, int(self.base_map[self.version_counter_key]))
+            self.base_map[self.version_counter_key] = str(version + 1).encode()
+        return version
+
+    def _set_version(
+        self,
+        version: int,
+        *args,
+        parent: Optional[int] = None,
+        snapshots: Optional[dict[str, int]] = None,
+    ) -> None:
+        with self._pointer_write_lock():
+            self._write_pointer(version, parent, snapshots)
+
+    def _write_pointer(
+        self,
+        version: int,
+        parent: Optional[int],
+        snapshots: Optional[dict[str, int]],
+    ) -> None:
+        pointer = self._read_pointer() or {}
+        versions = pointer.get("versions", [])
+        versions = versions + [version] if version not in versions else versions
+        parents = pointer.get("parents", {})
+        if parent is not None:
+            parents[str(version)] = parent
+        snapshots = pointer.get("snapshots", {}) if snapshots is None else snapshots
+
+        # The versions of the snapshots and the parents of the kept versions can not be deleted
+        required = set()
+        for required_version in versions[-self.keep_versions :] + list(
+            snapshots.values()
+        ):
+            while required_version is not None and required_version not in required:
+                required.add(required_version)
+                required_version = parents.get(str(required_version))
+
+        self.base_map[self.version_key] = orjson.dumps(
+            {
+                "version": version,
+                "versions": [v for v in versions if v in required],
+                "parents": {k: v for k, v in parents.items() if int(k) in required},
+                "snapshots": snapshots,
+            }
+        )
+        self._dataset_cache = None
+
+        for old_version in versions:
+            if old_version not in required:
+                self._layer_map(old_version).rmdir()
+        if not pointer and self._metadata_key(None) in self.base_map:
+            # Delete the data stored before enabling the versioned option
+            for key in list(self.base_map.keys()):
+                if not key.startswith(self.versions_prefix) and key != self.version_key:
+                    del self.base_map[key]
+
+    def _add_layer(self, parent: int, snapshots: Optional[dict[str, int]] = None):
+        # Create a new version that only stores the modifications made over the parent version,
+        # the consolidated metadata is copied to keep it always on the newest layer
+        pointer = self._read_pointer()
+        version = self._allocate_version()
+        layer_map = self._layer_map(version)
+        layer_map.rmdir()
+        metadata_key = self._metadata_key(None)
+        layer_map[metadata_key] = self._data_map(parent, pointer)[metadata_key]
+        self._set_version(version, parent=parent, snapshots=snapshots)
+        if len(self._layer_chain(version, self._read_pointer())) > self.max_layers:
+            self._flatten_layers()
+
+    def _flatten_layers(self):
+        # Copy the keys of the actual version on a new version without parents, so the reads only
+        # need one lookup per key, the layers used by the snapshots are not modified
+        pointer = self._read_pointer()
+        version = self._allocate_version()
+        flat_map = self._layer_map(version)
+        flat_map.rmdir()
+        seen = set()
+        for layer in self._layer_chain(pointer["version"], pointer):
+            layer_map = self._layer_map(layer)
+            keys = [key for key in layer_map.keys() if key not in seen]
+            seen.update(keys)
+            for batch in mit.chunked(keys, 256):
+                # The empty values are the keys deleted
+                flat_map.setitems(
+                    {k: v for k, v in layer_map.getitems(batch).items() if len(v)}
+                )
+        self._set_version(version)
+
+    def snapshot(self, name: str = None) -> str:
+        """
+        Create a snapshot of the actual state of the tensor without copying the data, the snapshot
+        records the keys of the tensor with a hash of their content (etag, checksum, or the md5 of the data
+        if the file system does not provide any of them), and all the writes made after it are stored
+        on a new layer (copy on write), so the snapshot can be read at any moment using the version parameter
+        of the read method. If the layers stacked by the snapshots exceed the max_layers option
+        the data is copied on a new version. It requires the versioned option.
+
+        Parameters
+        ----------
+
+        name: str, default None
+            Name of the snapshot, by default the number of the actual version is used
+
+        Returns
+        -------
+        The name of the snapshot
+        """
+        self._compact_append_log()
+        pointer = self._read_pointer()
+        if pointer is None:
+            raise ValueError(
+                "The snapshots require the versioned option and a stored tensor"
+            )
+        version = pointer["version"]
+        name = str(version) if name is None else name
+        snapshots = pointer.get("snapshots", {})
+        if name in snapshots:
+            raise ValueError(f"The snapshot {name} already exists")
+
+        manifest = {}
+        seen = set()
+        for layer in self._layer_chain(version, pointer):
+            layer_map = self._layer_map(layer)
+            missing = []
+            for key, info in layer_map.list_info().items():
+                if key in seen:
+                    continue
+                seen.add(key)
+                # The empty files are the keys deleted
+                if not info.get("size"):
+                    continue
+                manifest[key] = Mapping.content_hash_from_info(info)
+                if manifest[key] is None:
+                    missing.append(key)
+            for batch in mit.chunked(missing, 256):
+                for key, value in layer_map.getitems(batch).items():
+                    manifest[key] = hashlib.md5(value).hexdigest()
+
+        self.base_map[f"{self.snapshots_prefix}{name}"] = orjson.dumps(
+            {"version": version, "keys": dict(sorted(manifest.items()))}
+        )
+        self._add_layer(parent=version, snapshots={**snapshots, name: version})
+        return name
+
+    def restore_snapshot(self, name: str):
+        """
+        Restore the tensor to the state that it had when the snapshot was created, no data is copied,
+        so the restoration is instant, and the snapshot is preserved.
+
+        Parameters
+        ----------
+
+        name: str
+            Name of the snapshot
+        """
+        self._compact_append_log()
+        self._add_layer(parent=self._snapshot_version(name))
+
+    def delete_snapshot(self, name: str):
+        """
+        Delete a snapshot, the data that is not used by the actual version or any other snapshot is deleted.
+
+        Parameters
+        ----------
+
+        name: str
+            Name of the snapshot
+        """
+        pointer = self._read_pointer()
+        self._snapshot_version(name)
+        snapshots = {k: v for k, v in pointer["snapshots"].items() if k != name}
+        self._set_version(pointer["version"], snapshots=snapshots)
+        del self.base_map[f"{self.snapshots_prefix}{name}"]
+
+    def get_snapshots(self) -> dict[str, int]:
+        """
+        Snapshots of the tensor and the version that they point to
+        """
+        pointer = self._read_pointer()
+        return {} if pointer is None else pointer.get("snapshots", {})
+
+    def get_snapshot_manifest(self, name: str) -> dict[str, Optional[str]]:
+        """
+        Keys of the tensor at the moment of creating the snapshot and the hash of their content
+        """
+        return orjson.loads(self.base_map[f"{self.snapshots_prefix}{name}"])["keys"]
+
+    def _snapshot_version(self, version: Union[int, str]) -> int:
+        if isinstance(version, int):
+            return version
+        snapshots = self.get_snapshots()
+        if version not in snapshots:
+            raise KeyError(f"The snapshot {version} does not exist")
+        return snapshots[version]
+
     def append(
         self,
         new_data: Union[xr.DataArray, xr.Dataset],
@@ -469,18 +1067,42 @@ class ZarrStorage(BaseStorage):
         Returns
         -------
 
-        A list of xr.backends.ZarrStore produced by the to_zarr method executed in every dimension
+        A list of xr.backends.ZarrStore produced by the to_zarr method executed in every dimension,
+        the list is empty if the data was written on the append log
 
         """
+        if self.append_log and self._append_to_log(new_data, fill_value=fill_value):
+            return []
+
+        return self._append_stored(new_data, compute=compute, fill_value=fill_value)
 
+    def _append_stored(
+        self,
+        new_data: Union[xr.DataArray, xr.Dataset],
+        compute: bool,
+        fill_value: Any,
+    ) -> list[xr.backends.ZarrStore]:
+        # Append the data directly on the Zarr arrays
         if not self.exist():
             return [self.store(new_data=new_data, compute=compute)]
 
-        complete_data, data_to_append, rewrite = self.append_preview(
+        act_data, data_to_append, rewrite = self._plan_append(
             new_data=new_data, fill_value=fill_value
         )
 
         if rewrite:
+            delayed_writes = self._insert_in_the_middle(
+                new_data=new_data, compute=compute, fill_value=fill_value
+            )
+            if delayed_writes is not None:
+                return delayed_writes
+
+            complete_data = self._complete_append(
+                act_data=act_data,
+                data_to_append=data_to_append,
+                fill_value=fill_value,
+                rewrite=rewrite,
+            )
             return [self.store(new_data=complete_data, compute=compute, rewrite=True)]
 
         # TODO: For some reason there is an error if more than one dim is tried to be append
@@ -490,7 +1112,16 @@ class ZarrStorage(BaseStorage):
         if len(data_to_append) > 1 and self.synchronizer is None:
             compute = True
 
-        dims = complete_data[list(complete_data.keys())[0]].dims
+        return self._append_data(act_data, data_to_append, compute=compute)
+
+    def _append_data(
+        self,
+        act_data: xr.Dataset,
+        data_to_append: dict[str | Hashable, xr.Dataset],
+        compute: bool,
+    ) -> list[xr.backends.ZarrStore]:
+        dims = act_data[list(act_data.keys())[0]].dims
+        data_map = self.data_map
         delayed_appends = []
         for dim in dims:
             if dim not in data_to_append:
@@ -498,7 +1129,7 @@ class ZarrStorage(BaseStorage):
 
             delayed_appends.append(
                 data_to_append[dim].to_zarr(
-                    self.base_map,
+                    data_map.as_zarr_store(),
                     append_dim=dim,
                     compute=compute,
                     synchronizer=self.synchronizer,
@@ -509,22 +1140,242 @@ class ZarrStorage(BaseStorage):
                 )
             )
 
+        self._dataset_cache = None
         return delayed_appends
 
+    append_log_prefix = "_append_log"
+
+    def _append_log_map(self) -> Mapping:
+        return self.base_map.sub_map(self.append_log_prefix)
+
+    def _append_log_keys(self) -> list[str]:
+        # The names of the deltas start with the time of creation, so sorting them gives the order of the appends
+        return sorted(self._append_log_map().keys())
+
+    @staticmethod
+    def _encode_delta(delta: xr.Dataset, fill_value: Any) -> bytes:
+        dims = delta[list(delta.keys())[0]].dims
+        arrays = {"dims": np.array(dims), "fill_value": np.asarray(fill_value)}
+        arrays.update({f"coords/{dim}": delta.indexes[dim].values for dim in dims})
+        arrays.update(
+            {f"data/{name}": arr.transpose(*dims).values for name, arr in delta.items()}
+        )
+        # The pickle is not allowed on the log, so the objects are stored as strings
+        arrays = {
+            k: v.astype(str) if v.dtype == object else v for k, v in arrays.items()
+        }
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _decode_delta(value: bytes) -> tuple[xr.Dataset, Any]:
+        with np.load(io.BytesIO(value), allow_pickle=False) as arrays:
+            dims = [str(dim) for dim in arrays["dims"]]
+            delta = xr.Dataset(
+                {
+                    k[len("data/") :]: (dims, arrays[k])
+                    for k in arrays.files
+                    if k.startswith("data/")
+                },
+                coords={dim: arrays[f"coords/{dim}"] for dim in dims},
+            )
+            return delta, arrays["fill_value"].item()
+
+    def _append_to_log(
+        self, new_data: Union[xr.DataArray, xr.Dataset], fill_value: Any
+    ) -> bool:
+        # Write the data as a delta on the append log, False is returned if the tensor does not exist,
+        # only the consolidated metadata is read to validate the dims of the data
+        try:
+            metadata = orjson.loads(self.base_map[self.metadata_key])
+        except KeyError:
+            return False
+        if not self.exist_on_metadata(metadata):
+            return False
+
+        prefix = "" if self.group is None else f"{self.group}/"
+        dims = metadata["metadata"][f"{prefix}{self.get_data_names_list()[0]}/.zattrs"][
+            "_ARRAY_DIMENSIONS"
+        ]
+        if set(dims) != set(new_data.dims):
+            raise ValueError(
+                f"The dimensions of the act_data {tuple(dims)}"
+                f" and new data {new_data.dims} are different"
+            )
+        if any(size == 0 for size in new_data.sizes.values()):
+            raise ValueError(f"The new data is empty {new_data.sizes}")
+
+        new_data = self._keep_unique_coords(new_data)
+        new_data = self._keep_sorted_coords(new_data)
+        new_data = self._transform_to_dataset(new_data, chunk_data=False)
+        new_data = new_data.transpose(*dims).compute()
+
+        key = f"{time.time_ns():020d}-{uuid.uuid4().hex}"
+        self._append_log_map()[key] = self._encode_delta(new_data, fill_value)
+        if self.max_append_log and len(self._append_log_keys()) >= self.max_append_log:
+            self.compact()
+        return True
+
+    def _read_append_log(self, keys: list[str]) -> list[tuple[xr.Dataset, Any]]:
+        # The deltas are never modified, so they are decoded only once
+        missing_keys = [key for key in keys if key not in self._append_log_cache]
+        values = {}
+        if missing_keys:
+            values = self._append_log_map().getitems(missing_keys)
+        self._append_log_cache = {
+            key: self._append_log_cache[key]
+            if key in self._append_log_cache
+            else self._decode_delta(values[key])
+            for key in keys
+            if key in self._append_log_cache or key in values
+        }
+        return list(self._append_log_cache.values())
+
+    def _delete_append_log(self, keys: list[str]):
+        log_map = self._append_log_map()
+        for key in keys:
+            # The key could be already deleted by a rewrite of the tensor
+            with contextlib.suppress(KeyError):
+                del log_map[key]
+            self._append_log_cache.pop(key, None)
+
+    def _fold_append_log(
+        self, act_data: xr.Dataset, deltas: list[tuple[xr.Dataset, Any]]
+    ) -> tuple[dict[str | Hashable, xr.Dataset], bool]:
+        # Generates the data that must be appended on every dimension to get the same result of
+        # appending the deltas one by one, the cells of the stored data are never modified and every new cell
+        # takes its value from the delta that created it, which is the last one that added any of its coords.
+        # The second element indicates if the order of a sorted dim is violated
+        dims = act_data[list(act_data.keys())[0]].dims
+        preferred_chunks = act_data[list(act_data.keys())[0]].encoding.get(
+            "preferred_chunks", {}
+        )
+
+        # Coords after applying all the deltas and the number of the delta that added every coord
+        coords = {dim: act_data.indexes[dim] for dim in dims}
+        steps = {dim: np.zeros(len(coords[dim]), dtype=int) for dim in dims}
+        rewrite = False
+        for step, (delta, _) in enumerate(deltas, 1):
+            self._validate_new_data(act_data, delta)
+            for dim in dims:
+                coord = delta.indexes[dim]
+                coord = coord[~coord.isin(coords[dim])]
+                if len(coord) == 0:
+                    continue
+                rewrite |= not self._validate_sorted_append(coords[dim], coord, dim)
+                coords[dim] = coords[dim].append(coord)
+                steps[dim] = np.concatenate([steps[dim], np.full(len(coord), step)])
+
+        data_to_append = {}
+        complete_coords = {dim: act_data.indexes[dim] for dim in dims}
+        complete_steps = {dim: steps[dim][: act_data.sizes[dim]] for dim in dims}
+        for dim in dims:
+            size = act_data.sizes[dim]
+            if len(coords[dim]) == size:
+                continue
+
+            reindex_coords = {**complete_coords, dim: coords[dim][size:]}
+            reindex_steps = {**complete_steps, dim: steps[dim][size:]}
+            cell_steps = xr.DataArray(
+                functools.reduce(np.maximum, np.ix_(*reindex_steps.values())),
+                dims=dims,
+            )
+            data = None
+            for step, (delta, fill_value) in enumerate(deltas, 1):
+                mask = cell_steps == step
+                if not mask.any():
+                    continue
+                step_data = delta.reindex(reindex_coords, fill_value=fill_value)
+                data = (
+                    step_data.where(mask)
+                    if data is None
+                    else step_data.where(mask, data)
+                )
+
+            data_to_append[dim] = data.chunk(
+                {
+                    k: self._regular_chunks(
+                        size=len(coord),
+                        chunk=preferred_chunks.get(k, len(coord) + size),
+                        offset=size if k == dim else 0,
+                    )
+                    for k, coord in reindex_coords.items()
+                }
+            )
+            complete_coords[dim] = coords[dim]
+            complete_steps[dim] = steps[dim]
+
+        return data_to_append, rewrite
+
+    def _apply_append_log(
+        self, dataset: Union[xr.DataArray, xr.Dataset]
+    ) -> Union[xr.DataArray, xr.Dataset]:
+        deltas = self._read_append_log(self._append_log_keys())
+        if not deltas:
+            return dataset
+
+        complete_data = self._transform_to_dataset(dataset, chunk_data=False)
+        data_to_append, rewrite = self._fold_append_log(complete_data, deltas)
+        for dim, data in data_to_append.items():
+            complete_data = xr.concat([complete_data, data], dim=dim)
+        if rewrite:
+            complete_data = self._keep_sorted_coords(complete_data)
+        return complete_data[self.data_names]
+
+    def compact(self) -> list[xr.backends.ZarrStore]:
+        """
+        Fold the deltas of the append log into the Zarr arrays, all the deltas are appended at once
+        using writes aligned with the chunks of the arrays, and then they are deleted from the log.
+        If the deltas violate the order of a sorted dim, all of them are folded in a unique rewrite of
+        the tensor, which keeps the log untouched.
+        If the process fails before deleting the deltas, applying them again has no effect because
+        the append never modifies the existing cells.
+
+        Returns
+        -------
+        A list of xr.backends.ZarrStore produced by the to_zarr method executed in every dimension
+        """
+        keys = self._append_log_keys()
+        if not keys:
+            return []
+
+        deltas = self._read_append_log(keys)
+        act_data = self._transform_to_dataset(self._read_stored(), chunk_data=False)
+        data_to_append, rewrite = self._fold_append_log(act_data, deltas)
+        if rewrite:
+            complete_data = act_data
+            for dim, data in data_to_append.items():
+                complete_data = xr.concat([complete_data, data], dim=dim)
+            complete_data = self._keep_sorted_coords(complete_data)
+            delayed_writes = [
+                self.store(new_data=complete_data, compute=True, rewrite=True)
+            ]
+        else:
+            delayed_writes = self._append_data(act_data, data_to_append, compute=True)
+
+        self._delete_append_log(keys)
+        return delayed_writes
+
+    def _compact_append_log(self):
+        if self.append_log:
+            self.compact()
+
     def update(
         self,
         new_data: Union[xr.DataArray, xr.Dataset],
         compute: bool = True,
         complete_update_dims: Union[list[str], str] = None,
         fill_value: Any = np.nan,
-    ) -> Union[xr.backends.ZarrStore, None]:
+    ) -> Union[xr.backends.ZarrStore, list[xr.backends.ZarrStore], None]:
         """
         Replace data on an existing Zarr files based on the new_data, internally calls the method
         `to_zarr <https://xr.pydata.org/en/stable/generated/xr.Dataset.to_zarr.html>`_ using the
         region parameter, so it automatically creates this region based on your new_data, in some
         cases it could even replace all the data in the file even if you only has two coords in your new_data
         this happened due that Xarray only allows to write in contiguous blocks (region)
-        (read carefully how the region parameter works in Xarray)
+        (read carefully how the region parameter works in Xarray).
+        Use the "chunks" update_mode to only write the chunks that contain cells to update.
 
         Parameters
         ----------
@@ -546,27 +1397,48 @@ class ZarrStorage(BaseStorage):
         -------
 
         A xr.backends.ZarrStore produced by the method
-        `to_zarr <https://xr.pydata.org/en/stable/generated/xr.Dataset.to_zarr.html>`_
+        `to_zarr <https://xr.pydata.org/en/stable/generated/xr.Dataset.to_zarr.html>`_,
+        or a list of them if the update_mode is "chunks"
         """
+        self._compact_append_log()
 
-        update_data, regions = self.update_preview(
-            new_data=new_data,
-            fill_value=fill_value,
-            complete_update_dims=complete_update_dims,
-        )
-        if not regions:
+        if self.update_mode == "chunks":
+            updates = self.update_chunks_preview(
+                new_data=new_data,
+                fill_value=fill_value,
+                complete_update_dims=complete_update_dims,
+            )
+        else:
+            updates = [
+                self.update_preview(
+                    new_data=new_data,
+                    fill_value=fill_value,
+                    complete_update_dims=complete_update_dims,
+                )
+            ]
+        updates = [(data, regions) for data, regions in updates if regions]
+        if not updates:
             return None
 
-        delayed_write = update_data.to_zarr(
-            self.base_map,
-            group=self.group,
-            compute=compute,
-            synchronizer=self.synchronizer,
-            region=regions,
-            # This option is safe based on this https://github.com/pydata/xarray/issues/9072
-            safe_chunks=False,
-        )
-        return delayed_write
+        data_map = self.data_map
+        delayed_writes = [
+            update_data.to_zarr(
+                data_map.as_zarr_store(),
+                group=self.group,
+                compute=compute,
+                synchronizer=self.synchronizer,
+                region=regions,
+                # This option is safe based on this https://github.com/pydata/xarray/issues/9072
+                safe_chunks=False,
+            )
+            for update_data, regions in updates
+        ]
+        # The update does not modify the coords or the shape of the tensor, so the cached dataset
+        # is still valid, but the consolidated metadata is rewritten, so its token must be refreshed
+        self._refresh_dataset_cache()
+        if self.update_mode == "chunks":
+            return delayed_writes
+        return delayed_writes[0]
 
     def upsert(
         self,
@@ -586,20 +1458,30 @@ class ZarrStorage(BaseStorage):
         if not self.exist():
             return [self.store(new_data, compute=compute)]
 
-        delayed_writes = [
-            self.update(
-                new_data, compute=compute, complete_update_dims=complete_update_dims
-            )
-        ]
+        delayed_writes = self.update(
+            new_data, compute=compute, complete_update_dims=complete_update_dims
+        )
+        if not isinstance(delayed_writes, list):
+            delayed_writes = [delayed_writes]
         delayed_writes.extend(
             self.append(new_data, compute=compute, fill_value=fill_value)
         )
         delayed_writes = [write for write in delayed_writes if write is not None]
         return delayed_writes
 
-    def drop(self, coords: dict, compute: bool = True) -> xr.backends.ZarrStore:
+    def drop(
+        self, coords: dict, compute: bool = True
+    ) -> Union[xr.backends.ZarrStore, list[xr.backends.ZarrStore]]:
         """
-        Drop coords of the tensor, this will rewrite the hole tensor using the rewrite option of store
+        Drop coords of the tensor, the coords at the end of a dimension are dropped resizing the arrays
+        in place, and the rest of coords are dropped shifting only the chunks after the first dropped coord
+        (read the max_rewrite_chunks parameter), in other cases this will rewrite the hole tensor
+        using the rewrite option of store.
+
+        The in place drop is always eager because the shifted chunks must be read before overwriting them,
+        so compute=False always rewrites the tensor. If a shift fails the original cells and size are restored,
+        but the concurrent readers can see the shifted cells before the arrays are resized,
+        so the tensor must be locked if they are not allowed.
 
         Parameters
         ----------
@@ -612,35 +1494,281 @@ class ZarrStorage(BaseStorage):
 
         Returns
         -------
-        An xr.backends.ZarrStore produced by the store method
+        An xr.backends.ZarrStore produced by the store method, or the list of xr.backends.ZarrStore
+        produced by the shifts if the tensor was modified in place
 
         """
-        new_data = self.read()
-        new_data = new_data.drop_sel(coords)
-        return self.store(new_data=new_data, compute=compute, rewrite=True)
+        self._compact_append_log()
+        stored_data = self._read_stored()
+        act_data = self._transform_to_dataset(stored_data, chunk_data=False)
+        drop_positions = None
+        if compute:
+            drop_positions = self._plan_drop(act_data, coords)
+        if drop_positions is None:
+            return self.store(
+                new_data=stored_data.drop_sel(coords), compute=compute, rewrite=True
+            )
+
+        preferred_chunks = act_data[list(act_data.keys())[0]].encoding[
+            "preferred_chunks"
+        ]
+        data_map = self.data_map
+        delayed_writes = []
+        for dim, positions in drop_positions.items():
+            size = act_data.sizes[dim]
+            new_size = size - len(positions)
+            chunk = preferred_chunks.get(dim, size)
+            start = positions[0] // chunk * chunk
+            if positions[0] == new_size:
+                # Only the metadata of the arrays is modified, no cell is overwritten
+                self._resize(data_map, dim, new_size)
+                self._dataset_cache = None
+            else:
+                # Shift the coords after the first dropped coord, the data must be loaded
+                # in memory because the same chunks are going to be overwritten
+                original_data = act_data.isel({dim: slice(start, None)}).load()
+                keep_positions = np.setdiff1d(
+                    np.arange(size - start), positions - start
+                )
+                delayed_writes.append(
+                    self._shift_tail(
+                        data_map=data_map,
+                        tail_data=self._chunk_tail(
+                            original_data.isel({dim: keep_positions}),
+                            preferred_chunks,
+                            dim,
+                            start,
+                        ),
+                        original_data=self._chunk_tail(
+                            original_data, preferred_chunks, dim, start
+                        ),
+                        dim=dim,
+                        start=start,
+                    )
+                )
+            if len(drop_positions) > 1:
+                # The positions of the next dims must be read from the modified arrays
+                act_data = self._transform_to_dataset(
+                    self._read_stored(), chunk_data=False
+                )
+
+        return delayed_writes
 
-    def read(self) -> Union[xr.DataArray, xr.Dataset]:
+    def _plan_drop(
+        self, act_data: xr.Dataset, coords: dict
+    ) -> Optional[dict[str, np.ndarray]]:
+        # Sorted positions to drop on every dimension, None means that the whole tensor must be rewritten
+        if not self.max_rewrite_chunks:
+            return None
+
+        preferred_chunks = act_data[list(act_data.keys())[0]].encoding[
+            "preferred_chunks"
+        ]
+        drop_positions = {}
+        for dim, coord in coords.items():
+            size = act_data.sizes[dim]
+            coord = np.atleast_1d(coord)
+            positions = act_data.indexes[dim].get_indexer(coord)
+            if (positions < 0).any():
+                raise KeyError(
+                    f"The coords {coord[positions < 0].tolist()} does not exist on the dim {dim}"
+                )
+            positions = np.unique(positions)
+            if len(positions) == 0:
+                continue
+            if len(positions) == size:
+                return None
+
+            chunk = preferred_chunks.get(dim, size)
+            start = positions[0] // chunk * chunk
+            is_tail = positions[0] == size - len(positions)
+            if not is_tail and -(-(size - start) // chunk) > self.max_rewrite_chunks:
+                return None
+            drop_positions[dim] = positions
+
+        return drop_positions
+
+    def _resize(self, data_map: Mapping, dim: str, size: int):
+        # Resize in place all the arrays that contain the dim, and update the consolidated metadata
+        group = zarr.open_group(
+            data_map.as_zarr_store(),
+            path=self.group,
+            mode="r+",
+            synchronizer=self.synchronizer,
+        )
+        for _, array in group.arrays():
+            dims = array.attrs.get("_ARRAY_DIMENSIONS", [])
+            if dim in dims:
+                array.resize(
+                    tuple(
+                        size if d == dim else s
+                        for d, s in zip(dims, array.shape, strict=True)
+                    )
+                )
+        zarr.consolidate_metadata(data_map.as_zarr_store(), path=self.group or "")
+
+    def delete_tensor(self):
+        super().delete_tensor()
+        self._dataset_cache = None
+        self._append_log_cache = {}
+
+    def _delete_stored(self) -> bool:
+        # Delete the data of the tensor keeping the deltas of the append log, they are still pending
+        # if the store is the rewrite made by the compaction, and they are only deleted after it finishes.
+        # True is returned if the log was kept
+        if not self.append_log or not self._append_log_keys():
+            self.delete_tensor()
+            return False
+
+        prefix = f"{self.append_log_prefix}/"
+        self.base_map.delitems(
+            [key for key in self.base_map.keys() if not key.startswith(prefix)]
+        )
+        self._dataset_cache = None
+        return True
+
+    version_key = ".zversion"
+    versions_prefix = "_versions/"
+    version_counter_key = "_versions/.zcounter"
+    snapshots_prefix = "_snapshots/"
+
+    def _read_pointer(self, retries: int = 5) -> Optional[dict]:
+        if not self.versioned:
+            return None
+        # The pointer can be read while another process is writing it, so an incomplete value is read again
+        for attempt in range(retries + 1):
+            try:
+                return orjson.loads(self.base_map[self.version_key])
+            except KeyError:
+                return None
+            except orjson.JSONDecodeError as e:
+                if attempt == retries:
+                    raise ValueError(
+                        f"The version pointer {self.version_key} can not be read"
+                    ) from e
+                time.sleep(0.01 * 2**attempt)
+
+    def _read_version(self) -> Optional[int]:
+        pointer = self._read_pointer()
+        return None if pointer is None else pointer["version"]
+
+    def _layer_map(self, version: int) -> Mapping:
+        return self.base_map.sub_map(f"{self.versions_prefix}{version}")
+
+    def _layer_chain(self, version: int, pointer: Optional[dict]) -> list[int]:
+        # Versions read by the version, from the newest layer to the oldest one
+        parents = {} if pointer is None else pointer.get("parents", {})
+        layers = [version]
+        while str(layers[-1]) in parents:
+            layers.append(parents[str(layers[-1])])
+        return layers
+
+    def _data_map(self, version: Optional[int], pointer: Optional[dict]) -> Mapping:
+        if version is None:
+            return self.base_map
+        layers = [self._layer_map(v) for v in self._layer_chain(version, pointer)]
+        if len(layers) == 1:
+            return layers[0]
+        return Mapping(LayeredMapping(layers))
+
+    @property
+    def data_map(self) -> Mapping:
+        """
+        Mapping where the data of the tensor is stored, it is equal to the base_map
+        unless the versioned option is enabled, in that case it points to the current version.
+        """
+        pointer = self._read_pointer()
+        return self._data_map(None if pointer is None else pointer["version"], pointer)
+
+    def _metadata_key(self, version: Optional[int]) -> str:
+        key = ".zmetadata" if self.group is None else f"{self.group}/.zmetadata"
+        if version is None:
+            return key
+        return f"{self.versions_prefix}{version}/{key}"
+
+    @property
+    def metadata_key(self) -> str:
+        # Location of the consolidated metadata relative to the base_map
+        return self._metadata_key(self._read_version())
+
+    def _metadata_token(self, version: Optional[int] = None) -> Optional[str]:
+        if not hasattr(self.base_map.mapper, "fs"):
+            return None
+        key = self._metadata_key(version)
+        return f"{key}-{self.base_map.version_token(key)}"
+
+    def _refresh_dataset_cache(self):
+        if self._dataset_cache is None:
+            return
+        try:
+            self._dataset_cache = (
+                self._metadata_token(self._read_version()),
+                self._dataset_cache[1],
+            )
+        except KeyError:
+            self._dataset_cache = None
+
+    def _open_dataset(self, version: Union[int, str] = None) -> xr.Dataset:
+        pointer = self._read_pointer()
+        if version is not None:
+            return xr.open_zarr(
+                self._data_map(
+                    self._snapshot_version(version), pointer
+                ).as_zarr_store(),
+                consolidated=True,
+                group=self.group,
+            )
+
+        version = None if pointer is None else pointer["version"]
+        token = None
+        if self.cache_dataset:
+            token = self._metadata_token(version)
+            if self._dataset_cache is not None and self._dataset_cache[0] == token:
+                return self._dataset_cache[1]
+
+        dataset = xr.open_zarr(
+            self._data_map(version, pointer).as_zarr_store(),
+            consolidated=True,
+            synchronizer=None if self.synchronize_only_write else self.synchronizer,
+            group=self.group,
+        )
+        if self.cache_dataset:
+            self._dataset_cache = (token, dataset)
+        return dataset
+
+    def read(self, version: Union[int, str] = None) -> Union[xr.DataArray, xr.Dataset]:
         """
         Read a tensor stored, internally it uses
         `open_zarr method <https://xr.pydata.org/en/stable/generated/xr.open_zarr.html>`_.
+        If the append_log option is enabled then the deltas of the log are applied over the stored data.
 
         Parameters
         ----------
 
+        version: Union[int, str], default None
+            Name of a snapshot or number of a version to read, by default the actual version is read.
+            Only valid if the versioned option is enabled.
+
         Returns
         -------
         An xr.DataArray or xr.Dataset that allow to read your tensor, that is the same result that you get with
         `open_zarr <https://xr.pydata.org/en/stable/generated/xr.open_zarr.html>`_ and then using the '[]'
         with some names or a name
         """
+        dataset = self._read_stored(version)
+        if self.append_log and version is None:
+            dataset = self._apply_append_log(dataset)
+        return dataset
+
+    def _read_stored(
+        self, version: Union[int, str] = None
+    ) -> Union[xr.DataArray, xr.Dataset]:
+        # Data stored on the Zarr arrays, without applying the append log
         try:
-            dataset = xr.open_zarr(
-                self.base_map,
-                consolidated=True,
-                synchronizer=None if self.synchronize_only_write else self.synchronizer,
-                group=self.group,
-            )
-            dataset = dataset[self.data_names]
+            dataset = self._open_dataset(version)
+            # A shallow copy avoids that the modifications on the attrs or encoding of the
+            # result are propagated to the cached dataset
+            dataset = dataset[self.data_names].copy(deep=False)
             return dataset
         except KeyError as e:
             raise KeyError(
@@ -650,7 +1778,8 @@ class ZarrStorage(BaseStorage):
 
     def exist(self) -> bool:
         """
-        Indicate if the tensor exist or not
+        Indicate if the tensor exist or not, it only reads the consolidated metadata of the tensor
+        and validates that all the data_names are on it.
 
         Parameters
         ----------
@@ -661,7 +1790,19 @@ class ZarrStorage(BaseStorage):
 
         """
         try:
-            self.read()
-            return True
+            return self.exist_on_metadata(self.base_map[self.metadata_key])
         except KeyError:
             return False
+
+    def exist_on_metadata(self, metadata: Union[bytes, dict]) -> bool:
+        """
+        Indicate if all the data_names of the tensor are on the consolidated metadata (.zmetadata),
+        useful for checking the existence of multiple tensors using a bulk read of their metadata.
+        """
+        if isinstance(metadata, bytes):
+            metadata = orjson.loads(metadata)
+        prefix = "" if self.group is None else f"{self.group}/"
+        arrays = metadata.get("metadata", {})
+        return all(
+            f"{prefix}{name}/.zarray" in arrays for name in self.get_data_names_list()
+        )
@@ -1,3 +1,4 @@
+from tensordb.utils.cache import LRUCache
 from tensordb.utils.dag import get_leaf_tasks, get_limit_dependencies, get_tensor_dag
 from tensordb.utils.tools import (
     empty_xarray,
@@ -16,4 +17,5 @@ __all__ = (
     "extract_paths_from_formula",
     "iter_by_group_chunks",
     "groupby_chunks",
+    "LRUCache",
 )
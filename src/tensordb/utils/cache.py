@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+
+class LRUCache:
+    """
+    Thread safe cache that discards the least recently used elements when it reaches its maximum size.
+
+    Parameters
+    ----------
+
+    maxsize: int, default None
+        Maximum number of elements kept on the cache, or maximum total size of the elements if the getsizeof
+        parameter is sent, None means no limit.
+
+    ttl: float, default None
+        Number of seconds that an element can live on the cache, None means that the elements never expire.
+
+    getsizeof: Callable[[Any], int], default None
+        Function used to calculate the size of every element, for example, the number of bytes,
+        by default every element has a size of one. It must be picklable to pickle the cache.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = None,
+        ttl: float = None,
+        getsizeof: Callable[[Any], int] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.getsizeof = getsizeof
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.monotonic() - created_at > self.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or self._is_expired(item[1]):
+                if item is not None:
+                    self.currsize -= self._data.pop(key)[2]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def __setitem__(self, key: Hashable, value: Any):
+        size = 1 if self.getsizeof is None else self.getsizeof(value)
+        with self._lock:
+            if key in self._data:
+                self.currsize -= self._data.pop(key)[2]
+            self._data[key] = (value, time.monotonic(), size)
+            self.currsize += size
+            while self.maxsize is not None and self.currsize > self.maxsize:
+                self.currsize -= self._data.popitem(last=False)[1][2]
+                self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and not self._is_expired(item[1])
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self) -> list[Hashable]:
+        with self._lock:
+            return list(self._data.keys())
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            self.currsize -= item[2]
+            return item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.currsize = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def info(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "currsize": self.currsize,
+        }
@@ -94,3 +94,36 @@ def get_limit_dependencies(total_tensors, max_parallelization_per_group):
                 )
                 prev_dependencies = set(act_tensors)
     return new_dependencies
+
+
+def get_critical_path(
+    dependencies: dict[str, set[str]], durations: dict[str, float]
+) -> list[str]:
+    # The critical path is the chain of dependencies with the biggest total duration,
+    # only the nodes with a duration are considered
+    remaining = {
+        path: set(dependencies.get(path, set())) & durations.keys()
+        for path in durations
+    }
+    costs = {}
+    previous = {}
+    while remaining:
+        ready = [
+            path
+            for path, depends in remaining.items()
+            if not depends & remaining.keys()
+        ]
+        if not ready:
+            raise ValueError(
+                f"There is a cyclic dependency between the tensors: {remaining}"
+            )
+        for path in ready:
+            previous[path] = max(remaining.pop(path), key=costs.get, default=None)
+            costs[path] = durations[path] + costs.get(previous[path], 0)
+
+    path = max(costs, key=costs.get, default=None)
+    critical_path = []
+    while path is not None:
+        critical_path.append(path)
+        path = previous[path]
+    return critical_path[::-1]
@@ -0,0 +1,110 @@
+import fsspec
+import numpy as np
+import pytest
+import xarray as xr
+
+from tensordb.storages import CachingMapping, Mapping, ZarrStorage
+
+
+class TestCachingMapping:
+    @pytest.fixture(autouse=True)
+    def setup_tests(self, tmpdir):
+        self.path = tmpdir.strpath + "/caching_mapping"
+        self.disk_map = fsspec.get_mapper(tmpdir.strpath + "/disk_cache")
+        self.mapping = CachingMapping(
+            fsspec.get_mapper(self.path, create=True, auto_mkdir=True),
+            maxsize=10,
+            disk_map=self.disk_map,
+        )
+        self.other_mapping = Mapping(fsspec.get_mapper(self.path))
+
+    def test_cache(self):
+        self.mapping["a/x"] = b"12345"
+        assert self.mapping["a/x"] == b"12345"
+        assert self.mapping.cache.info()["currsize"] == 5
+
+        # The sub maps share the cache, and the writes invalidate it
+        sub_map = self.mapping.sub_map("a")
+        assert sub_map["x"] == b"12345"
+        assert self.mapping.cache.info()["hits"] == 1
+        sub_map["x"] = b"123"
+        assert self.mapping["a/x"] == b"123"
+
+        # The modifications made by other mappings are detected using the etag and size
+        self.other_mapping["a/x"] = b"abcdef"
+        assert self.mapping["a/x"] == b"abcdef"
+
+        del self.mapping["a/x"]
+        assert "a/x" not in self.mapping
+        with pytest.raises(KeyError):
+            self.mapping["a/x"]
+
+    def test_disk_tier(self, monkeypatch):
+        self.mapping.setitems({"a": b"123456", "b": b"7890123"})
+        assert self.mapping.getitems(["a", "b", "c"]) == {
+            "a": b"123456",
+            "b": b"7890123",
+        }
+        # Only the last value fits in memory, so the first one is read from the disk
+        assert self.mapping.cache.keys() == [self.mapping.full_path("b")]
+        assert len(self.disk_map) == 2
+        assert self.mapping["a"] == b"123456"
+
+        self.mapping.delitems(["a"])
+        assert len(self.disk_map) == 1
+
+        self.mapping.setitems({"c/x": b"1", "c/d/y": b"2", "cc/x": b"3"})
+        self.mapping.getitems(["c/x", "c/d/y", "cc/x"])
+        # Only the folder of the prefix is deleted from the disk, without listing the rest of entries
+        monkeypatch.setattr(
+            self.mapping.disk_map, "keys", lambda *args: pytest.fail("Listed disk")
+        )
+        self.mapping.rmdir("c")
+        assert sorted(self.disk_map) == sorted(
+            self.mapping._disk_path(self.mapping.full_path(key))
+            for key in ["b", "cc/x"]
+        )
+        assert self.mapping.getitems(["c/x", "c/d/y"]) == {}
+
+    def test_bulk_tokens(self, monkeypatch):
+        self.mapping.setitems({"a": b"1", "b": b"2"})
+        assert self.mapping.getitems(["a", "b"]) == {"a": b"1", "b": b"2"}
+
+        # The tokens are requested in bulk, not one by one before the read
+        monkeypatch.setattr(
+            self.mapping, "version_token", lambda *args: pytest.fail("Token of a key")
+        )
+        getitems = Mapping.getitems
+        read_keys = []
+
+        def record_getitems(mapping, keys, **kwargs):
+            read_keys.extend(keys)
+            return getitems(mapping, keys, **kwargs)
+
+        monkeypatch.setattr(Mapping, "getitems", record_getitems)
+        # Only the modified key is read again
+        self.other_mapping["b"] = b"23"
+        assert self.mapping.getitems(["a", "b", "c"]) == {"a": b"1", "b": b"23"}
+        assert read_keys == ["b"]
+
+    def test_zarr_storage(self):
+        storage = ZarrStorage(
+            base_map=self.mapping.sub_map("zarr"),
+            tmp_map=self.mapping.sub_map("tmp/zarr"),
+            data_names="data_test",
+            chunks={"index": 2},
+        )
+        self.mapping.cache.maxsize = 2**20
+        arr = xr.DataArray(
+            np.arange(20.0).reshape(5, 4),
+            dims=["index", "columns"],
+            coords={"index": list(range(5)), "columns": list(range(4))},
+        )
+        storage.store(arr)
+        assert storage.read().equals(arr)
+        hits = self.mapping.cache.info()["hits"]
+        assert storage.read().equals(arr)
+        assert self.mapping.cache.info()["hits"] > hits
+
+        storage.update(arr.isel(index=[0]) * 10)
+        assert storage.read().isel(index=0).equals(arr.isel(index=0) * 10)
@@ -1,3 +1,12 @@
+import fsspec
+import numpy as np
+import pytest
+import xarray as xr
+from fsspec.implementations.asyn_wrapper import AsyncFileSystemWrapper
+from fsspec.mapping import FSMap
+
+from tensordb.storages import CachingMapping, Mapping, PrefixLock, ZarrStorage
+
 # import fsspec
 # import pytest
 # import json
@@ -47,3 +56,177 @@
 #     kazoo_mapping['test'] = json.dumps({"aj": 1}).encode('utf-8')
 #     raise ValueError
 #
+
+
+class RecordLock:
+    acquired = []
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.acquired.append(self.path)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class TestMapping:
+    @pytest.fixture(autouse=True)
+    def setup_tests(self, tmpdir):
+        RecordLock.acquired = []
+        self.mapping = Mapping(
+            fsspec.get_mapper(
+                tmpdir.strpath + "/mapping", create=True, auto_mkdir=True
+            ),
+            write_lock=PrefixLock("", lock=RecordLock),
+        )
+        self.dict_mapping = Mapping({}, sub_path="sub")
+
+    @pytest.mark.parametrize("use_dict", [True, False])
+    def test_bulk_methods(self, use_dict):
+        mapping = self.dict_mapping if use_dict else self.mapping
+        mapping.setitems({"b": b"2", "a": b"1", "c": b"3"})
+        assert mapping.getitems(["a", "b", "d"]) == {"a": b"1", "b": b"2"}
+        mapping.delitems(["a", "c"])
+        assert list(mapping.keys()) == ["b"]
+        if use_dict:
+            assert list(mapping.mapper) == ["sub/b"]
+        else:
+            # The locks are always acquired sorted to avoid deadlocks
+            assert RecordLock.acquired == ["a", "b", "c", "a", "c"]
+
+    @pytest.mark.parametrize("use_dict", [True, False])
+    def test_rmdir(self, use_dict):
+        mapping = self.dict_mapping if use_dict else self.mapping
+        mapping.setitems({f"a/{i}": b"1" for i in range(5)})
+        mapping["b"] = b"2"
+        mapping.rmdir("a", batch_size=2)
+        assert list(mapping.keys()) == ["b"]
+        # Deleting a missing prefix has no effect
+        mapping.rmdir("a")
+        mapping.rmdir()
+        assert list(mapping.keys()) == []
+
+    def test_synchronize(self, tmpdir):
+        remote_map = Mapping(fsspec.get_mapper(tmpdir.strpath + "/remote"))
+        local_map = Mapping(fsspec.get_mapper(tmpdir.strpath + "/local"))
+        checksum_map = Mapping(fsspec.get_mapper(tmpdir.strpath + "/checksum"))
+        for key in ["a", "b/0", "b/1"]:
+            remote_map[key] = key.encode()
+
+        Mapping.synchronize(remote_map, local_map, checksum_map, to_local=True)
+        assert local_map.getitems(["a", "b/0", "b/1"]) == remote_map.getitems(
+            ["a", "b/0", "b/1"]
+        )
+        tokens = local_map.list_tokens()
+
+        # Only the modified keys are transferred, and the deleted ones are dropped
+        remote_map["b/1"] = b"new"
+        del remote_map["a"]
+        Mapping.synchronize(
+            remote_map, local_map, checksum_map, to_local=True, max_workers=2
+        )
+        assert sorted(local_map.keys()) == ["b/0", "b/1"]
+        assert local_map["b/1"] == b"new"
+        assert local_map.list_tokens()["b/0"] == tokens["b/0"]
+
+        local_map["b/0"] = b"local"
+        local_map["c"] = b"c"
+        Mapping.synchronize(remote_map, local_map, checksum_map, to_local=False)
+        assert remote_map.getitems(["b/0", "c"]) == {"b/0": b"local", "c": b"c"}
+
+        # The local modifications are overwritten by the remote data
+        local_map["c"] = b"modified"
+        Mapping.synchronize(remote_map, local_map, checksum_map, to_local=True)
+        assert local_map["c"] == b"c"
+
+    @pytest.mark.parametrize("use_async", [True, False])
+    def test_version_tokens(self, tmpdir, use_async):
+        fs = fsspec.filesystem("file", auto_mkdir=True)
+        if use_async:
+            fs = AsyncFileSystemWrapper(fs)
+        mapping = Mapping(FSMap(tmpdir.strpath + "/tokens", fs), sub_path="sub")
+        mapping.setitems({"a": b"1", "b/c": b"22"})
+        assert mapping.version_tokens(["a", "b/c", "d"]) == {
+            key: mapping.version_token(key) for key in ["a", "b/c"]
+        }
+
+    @pytest.mark.parametrize("use_async", [True, False])
+    def test_folders_synchronize(self, tmpdir, use_async):
+        fs = fsspec.filesystem("file", auto_mkdir=True)
+        if use_async:
+            fs = AsyncFileSystemWrapper(fs)
+        source = Mapping(FSMap(tmpdir.strpath + "/source", fs))
+        destination = Mapping(FSMap(tmpdir.strpath + "/destination", fs))
+        source.setitems({"a/0": b"0", "a/1": b"11", "b/0": b"222", "c/0": b"3"})
+        destination.setitems({"a/2": b"2", "c/0": b"4"})
+
+        modified_files = source.folders_synchronize(
+            destination, ["a", "b"], n_threads=2, max_inflight_bytes=2
+        )
+        assert sorted(modified_files) == ["a/0", "a/1", "a/2", "b/0"]
+        assert sorted(destination.keys()) == ["a/0", "a/1", "b/0", "c/0"]
+        assert destination["b/0"] == b"222"
+        assert destination["c/0"] == b"4"
+
+        # Without etags the modification time is not enough to know that the files did not change,
+        # so the content is compared
+        assert (
+            source.folders_synchronize(
+                destination, ["a", "b"], comparing_method="content"
+            )
+            == []
+        )
+        source["a/1"] = b"33"
+        assert source.folders_synchronize(
+            destination, ["a"], comparing_method="content"
+        ) == ["a/1"]
+        assert destination["a/1"] == b"33"
+
+        # A file with the same size and a more recent modification time can still be different
+        destination["a/0"] = b"9"
+        assert source.folders_synchronize(
+            destination, ["a"], comparing_method="content"
+        ) == ["a/0"]
+        assert destination["a/0"] == b"0"
+
+    def test_folders_synchronize_cached_destination(self, tmpdir):
+        fs = AsyncFileSystemWrapper(fsspec.filesystem("file", auto_mkdir=True))
+        source = Mapping(FSMap(tmpdir.strpath + "/source", fs))
+        destination = CachingMapping(
+            FSMap(tmpdir.strpath + "/destination", fs), validate=False
+        )
+        source.setitems({"a/0": b"new", "a/1": b"1"})
+        destination.setitems({"a/0": b"old", "a/2": b"2"})
+        assert destination.getitems(["a/0", "a/2"]) == {"a/0": b"old", "a/2": b"2"}
+
+        # The writes made directly on the file system invalidate the cached values
+        source.folders_synchronize(destination, ["a"])
+        assert destination["a/0"] == b"new"
+        assert "a/2" not in destination
+        assert destination.getitems(["a/0", "a/1", "a/2"]) == {
+            "a/0": b"new",
+            "a/1": b"1",
+        }
+
+    def test_zarr_bulk_writes(self):
+        storage = ZarrStorage(
+            base_map=self.mapping.sub_map("zarr"),
+            tmp_map=self.mapping.sub_map("tmp"),
+            data_names="data",
+            chunks={"index": 1},
+        )
+        arr = xr.DataArray(
+            np.arange(6.0).reshape(3, 2),
+            dims=["index", "columns"],
+            coords={"index": [0, 1, 2], "columns": [0, 1]},
+        )
+        storage.store(arr)
+        RecordLock.acquired = []
+        storage.update(arr * 2)
+        # The chunks are written using a unique bulk request that holds the locks of all of them
+        assert {"zarr/data/0.0", "zarr/data/1.0", "zarr/data/2.0"} <= set(
+            RecordLock.acquired
+        )
+        assert storage.read().equals(arr * 2)
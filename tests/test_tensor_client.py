@@ -1,8 +1,11 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import dask.threaded
 import fsspec
 import numpy as np
+import pandas as pd
 import pytest
 import xarray as xr
 import zarr
@@ -120,6 +123,60 @@ class TestTensorClient:
         self.local_tensor_client.create_tensor(d)
         assert definition == self.local_tensor_client.get_tensor_definition(path)
 
+    def test_definition_cache(self, tmpdir):
+        base_map = fsspec.get_mapper(tmpdir.strpath + "/cached_definitions")
+        tensor_client = TensorClient(
+            base_map=base_map,
+            definition_cache_size=2,
+            definition_cache_validation="mtime",
+        )
+        other_client = TensorClient(base_map=base_map)
+        tensor_client.create_tensor(TensorDefinition(path="cached"))
+
+        definition = tensor_client.get_tensor_definition("cached")
+        definition.metadata["modified_copy"] = True
+        assert tensor_client.get_tensor_definition("cached").metadata == {}
+        assert tensor_client._definitions_cache.hits == 1
+
+        # A modification made by another client must be detected by the validation
+        other_client.update_tensor_metadata("cached", {"a": 1})
+        assert tensor_client.get_tensor_definition("cached").metadata == {"a": 1}
+
+        tensor_client.delete_tensor("cached")
+        assert "cached" not in tensor_client._definitions_cache
+        with pytest.raises(KeyError):
+            tensor_client.get_tensor_definition("cached")
+
+        # The validation without a cache would be silently ignored
+        with pytest.raises(ValueError):
+            TensorClient(base_map=base_map, definition_cache_validation="mtime")
+
+    def test_storage_pool(self, tmpdir):
+        tensor_client = TensorClient(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/pooled_storages"),
+            storage_pool_size=1,
+        )
+        tensor_client.create_tensor(TensorDefinition(path="pooled"))
+        tensor_client.create_tensor(TensorDefinition(path="pooled_two"))
+
+        storage = tensor_client.get_storage("pooled")
+        assert tensor_client.get_storage("pooled") is storage
+        assert tensor_client.storage_pool.info()["hits"] == 1
+
+        # The pool only keeps one storage, so the first one must be evicted
+        tensor_client.get_storage("pooled_two")
+        assert tensor_client.get_storage("pooled") is not storage
+
+        # Any change on the storage definition must generate a new storage
+        storage = tensor_client.get_storage("pooled")
+        tensor_client.upsert_tensor(
+            TensorDefinition(path="pooled", storage={"data_names": "other"})
+        )
+        new_storage = tensor_client.get_storage("pooled")
+        assert new_storage is not storage
+        assert new_storage.data_names == "other"
+        assert tensor_client.storage_pool.info()["misses"] == 4
+
     @pytest.mark.parametrize("use_local", [True, False])
     def test_store(self, use_local):
         tensor_client = self.local_tensor_client if use_local else self.tensor_client
@@ -186,6 +243,312 @@ class TestTensorClient:
         tensor_client.delete_tensor("data_one")
         assert not tensor_client.exist("data_one")
 
+    def test_bulk_exist(self):
+        tensor_client = self.local_tensor_client
+        tensor_client.create_tensor(TensorDefinition(path="no_data"))
+        tensor_client.create_tensor(
+            TensorDefinition(
+                path="formula",
+                definition={
+                    "read": {"substitute_method": "read_from_formula"},
+                    "read_from_formula": {"formula": "`data_one` + 1"},
+                },
+            )
+        )
+        tensor_client.create_tensor(
+            TensorDefinition(
+                path="other_data_names", storage={"data_names": "other_name"}
+            )
+        )
+        tensor_client.get_storage("other_data_names").base_map.update(
+            tensor_client.get_storage("data_two").base_map
+        )
+        paths = ["data_one", "missing", "no_data", "formula", "other_data_names"]
+        expected = {
+            "data_one": True,
+            "missing": False,
+            "no_data": False,
+            "formula": True,
+            "other_data_names": False,
+        }
+        assert tensor_client.bulk_exist(paths) == expected
+        assert {path: tensor_client.exist(path) for path in paths} == expected
+
+    def test_get_all_tensors_definition(self):
+        tensor_client = self.local_tensor_client
+        tensor_client.create_tensor(TensorDefinition(path="folder/nested"))
+        expected = {
+            definition.path: definition
+            for definition in map(
+                tensor_client.get_tensor_definition,
+                tensor_client._tensors_definition.base_map.keys(),
+            )
+        }
+        definitions = tensor_client.get_all_tensors_definition(batch_size=2)
+        assert {definition.path: definition for definition in definitions} == expected
+
+        # Without the consolidated file all the definitions are read one by one
+        definitions = tensor_client.get_all_tensors_definition(consolidated=True)
+        assert {definition.path: definition for definition in definitions} == expected
+
+        tensor_client.consolidate_definitions()
+        definitions = tensor_client.get_all_tensors_definition(
+            batch_size=1, max_workers=1
+        )
+        assert {definition.path: definition for definition in definitions} == expected
+
+        tensor_client.create_tensor(TensorDefinition(path="not_consolidated"))
+        definitions = tensor_client.get_all_tensors_definition(consolidated=True)
+        assert {definition.path: definition for definition in definitions} == expected
+
+    def test_definitions_catalog(self, tmpdir, monkeypatch):
+        tensor_client = TensorClient(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/catalog"),
+            definitions_catalog=True,
+        )
+        assert tensor_client.get_catalog_version() is None
+        tensor_client.create_tensor(TensorDefinition(path="first"))
+        tensor_client.create_tensor(TensorDefinition(path="folder/second"))
+        tensor_client.upsert_tensor(TensorDefinition(path="first", metadata={"a": 1}))
+        tensor_client.create_tensor(TensorDefinition(path="deleted"))
+        tensor_client.delete_tensor("deleted")
+        assert tensor_client.get_catalog_version() == 4
+
+        # The definitions must be read only from the catalog
+        def fail_getitems(*args, **kwargs):
+            raise AssertionError("The definitions must be read from the catalog")
+
+        monkeypatch.setattr(
+            tensor_client._tensors_definition.base_map, "getitems", fail_getitems
+        )
+        definitions = tensor_client.get_all_tensors_definition()
+        assert {definition.path: definition for definition in definitions} == {
+            "first": TensorDefinition(path="first", metadata={"a": 1}),
+            "folder/second": TensorDefinition(path="folder/second"),
+        }
+        monkeypatch.undo()
+
+        # The definitions modified without updating the catalog are the only ones read again
+        other_client = TensorClient(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/catalog")
+        )
+        other_client.upsert_tensor(TensorDefinition(path="first", metadata={"a": 2}))
+        other_client.create_tensor(TensorDefinition(path="not_in_catalog"))
+        getitems = tensor_client._tensors_definition.base_map.getitems
+        read_keys = []
+
+        def record_getitems(keys, **kwargs):
+            read_keys.extend(keys)
+            return getitems(keys, **kwargs)
+
+        monkeypatch.setattr(
+            tensor_client._tensors_definition.base_map, "getitems", record_getitems
+        )
+        definitions = tensor_client.get_all_tensors_definition()
+        assert sorted(read_keys) == ["first", "not_in_catalog"]
+        assert {definition.path: definition for definition in definitions} == {
+            "first": TensorDefinition(path="first", metadata={"a": 2}),
+            "folder/second": TensorDefinition(path="folder/second"),
+            "not_in_catalog": TensorDefinition(path="not_in_catalog"),
+        }
+        monkeypatch.undo()
+        other_client.delete_tensor("not_in_catalog")
+
+        # A missing catalog is rebuilt on the next modification
+        del tensor_client._tensors_definition.base_map[tensor_client.consolidated_key]
+        assert len(tensor_client.get_all_tensors_definition()) == 2
+        tensor_client.create_tensor(TensorDefinition(path="third"))
+        assert tensor_client.get_catalog_version() == 0
+        assert len(tensor_client.get_all_tensors_definition()) == 3
+
+    def test_snapshots(self):
+        tensor_client = self.local_tensor_client
+        tensor_client.create_tensor(
+            TensorDefinition(path="versioned", storage={"versioned": True})
+        )
+        tensor_client.store(path="versioned", new_data=self.arr)
+        tensor_client.snapshot("versioned", "before_update")
+        tensor_client.update(path="versioned", new_data=self.arr + 1)
+        assert tensor_client.read("versioned").equals(self.arr + 1)
+        assert tensor_client.read("versioned", version="before_update").equals(self.arr)
+        assert list(tensor_client.get_snapshots("versioned")) == ["before_update"]
+
+        tensor_client.restore_snapshot("versioned", "before_update")
+        assert tensor_client.read("versioned").equals(self.arr)
+        tensor_client.delete_snapshot("versioned", "before_update")
+        assert tensor_client.get_snapshots("versioned") == {}
+
+    def test_fetch_fast_path(self, monkeypatch):
+        self.tensor_client.create_tensor(TensorDefinition(path="fast_path"))
+        self.tensor_client.store(path="fast_path", new_data=self.arr)
+        remote_client = self.tensor_client.remote_client
+
+        # The local copy is synchronized, so only the definitions are compared
+        def fail_remote(*args, **kwargs):
+            raise AssertionError(
+                "The remote must not be used if the copy is synchronized"
+            )
+
+        monkeypatch.setattr(self.tensor_client, "fetch", fail_remote)
+        monkeypatch.setattr(remote_client, "exist", fail_remote)
+        monkeypatch.setattr(remote_client, "read", fail_remote)
+        assert self.tensor_client.read("fast_path").equals(self.arr)
+        monkeypatch.undo()
+
+        remote_client.update(path="fast_path", new_data=self.arr * 2)
+        remote_client.update_tensor_metadata(
+            "fast_path", {"modification_date": str(pd.Timestamp.now())}
+        )
+        assert self.tensor_client.read("fast_path").equals(self.arr * 2)
+
+    @pytest.mark.parametrize("only_definition", [True, False])
+    def test_fetch_missing_local_data(self, only_definition):
+        self.tensor_client.create_tensor(TensorDefinition(path="missing_local"))
+        self.tensor_client.store(path="missing_local", new_data=self.arr)
+        if only_definition:
+            self.tensor_client.local_client.delete_tensor("missing_local")
+            self.tensor_client.fetch("missing_local", only_definition=True)
+        else:
+            self.tensor_client.delete_tensor(
+                "missing_local", only_data=True, only_local=True
+            )
+
+        # The definitions are synchronized but the data must be downloaded again
+        assert self.tensor_client.read("missing_local").equals(self.arr)
+
+        self.tensor_client.local_client.delete_tensor("missing_local", only_data=True)
+        new_data = self.arr.isel(index=[-1]).assign_coords(index=[5])
+        self.tensor_client.append(path="missing_local", new_data=new_data)
+        expected = xr.concat([self.arr, new_data], dim="index")
+        assert self.tensor_client.remote_client.read("missing_local").equals(expected)
+
+    def test_lazy_fetch(self, tmpdir):
+        path = tmpdir.strpath
+        remote_client = self.tensor_client.remote_client
+        local_client = TensorClient(base_map=fsspec.get_mapper(path + "/lazy_local"))
+        tensor_client = FileCacheTensorClient(
+            local_client=local_client,
+            remote_client=remote_client,
+            checksum_path="checksum",
+            tensor_lock=zarr.ThreadSynchronizer(),
+            fetch_mode="lazy",
+        )
+        remote_client.create_tensor(
+            TensorDefinition(
+                path="lazy",
+                storage={"chunks": {"index": 2, "columns": 5}},
+                metadata={"modification_date": "2020-01-01"},
+            )
+        )
+        remote_client.store(path="lazy", new_data=self.arr)
+
+        # Only the chunks read are downloaded
+        result = tensor_client.read("lazy").isel(index=[-1]).compute()
+        assert result.equals(self.arr.isel(index=[-1]))
+        local_map = local_client.base_map.sub_map("lazy")
+        assert "data/2.0" in local_map and "data/0.0" not in local_map
+
+        # The modified chunks are deleted from the local and downloaded again
+        remote_client.update(path="lazy", new_data=self.arr.isel(index=[-1]) * 2)
+        remote_client.update_tensor_metadata(
+            "lazy", {"modification_date": "2020-01-02"}
+        )
+        assert "data/2.0" in local_map
+        result = tensor_client.read("lazy").isel(index=[-1]).compute()
+        assert result.equals(self.arr.isel(index=[-1]) * 2)
+
+        # The writes transfer all the tensor first, so the merge does not delete remote data
+        tensor_client.update(path="lazy", new_data=self.arr.isel(index=[0]) * 3)
+        expected = self.arr.copy()
+        expected[0] = expected[0] * 3
+        expected[-1] = expected[-1] * 2
+        assert remote_client.read("lazy").equals(expected)
+        assert "data/1.0" in local_map
+
+    @pytest.mark.parametrize("synchronizer_mode", ["automatic", "delayed"])
+    def test_background_merge(self, tmpdir, synchronizer_mode):
+        path = tmpdir.strpath
+        remote_client = self.tensor_client.remote_client
+        tensor_client = FileCacheTensorClient(
+            local_client=TensorClient(base_map=fsspec.get_mapper(path + "/bg_local")),
+            remote_client=remote_client,
+            checksum_path="checksum",
+            tensor_lock=zarr.ThreadSynchronizer(),
+            synchronizer_mode=synchronizer_mode,
+            merge_mode="background",
+        )
+        tensor_client.create_tensor(TensorDefinition(path="background"))
+        tensor_client.store(path="background", new_data=self.arr)
+        tensor_client.update(path="background", new_data=self.arr * 2)
+
+        # The local writes are visible before the merge finishes
+        assert tensor_client.read("background").equals(self.arr * 2)
+
+        tensor_client.wait_merged("background")
+        assert remote_client.read("background").equals(self.arr * 2)
+
+        tensor_client.append(
+            path="background",
+            new_data=self.arr2.assign_coords(index=[5, 6, 7, 8, 9]),
+        )
+        tensor_client.flush()
+        assert remote_client.read("background").sizes["index"] == 10
+
+    def test_background_merge_failure(self, tmpdir, monkeypatch):
+        path = tmpdir.strpath
+        remote_client = self.tensor_client.remote_client
+        tensor_client = FileCacheTensorClient(
+            local_client=TensorClient(base_map=fsspec.get_mapper(path + "/bg_local")),
+            remote_client=remote_client,
+            checksum_path="checksum",
+            tensor_lock=zarr.ThreadSynchronizer(),
+            merge_mode="background",
+            merge_retries=1,
+            merge_retry_wait=0.01,
+        )
+        tensor_client.create_tensor(TensorDefinition(path="failed"))
+        merge = tensor_client._merge
+
+        def failing_merge(*args, **kwargs):
+            raise OSError("Failed merge")
+
+        monkeypatch.setattr(tensor_client, "_merge", failing_merge)
+        tensor_client.store(path="failed", new_data=self.arr)
+        with pytest.raises(OSError, match="Failed merge"):
+            tensor_client.flush()
+        with pytest.raises(OSError, match="Failed merge"):
+            tensor_client.wait_merged("failed")
+
+        # The local writes are kept as not merged, so they are not overwritten by the remote data
+        assert tensor_client._merge_pending("failed")
+        assert tensor_client.read("failed").equals(self.arr)
+
+        # The next write merges all the pending writes
+        monkeypatch.setattr(tensor_client, "_merge", merge)
+        tensor_client.update(path="failed", new_data=self.arr.isel(index=[0]) * 2)
+        tensor_client.flush()
+        expected = self.arr.copy()
+        expected[0] = expected[0] * 2
+        assert remote_client.read("failed").equals(expected)
+        assert not tensor_client._merge_pending("failed")
+
+    def test_chunk_cache(self, tmpdir):
+        tensor_client = TensorClient(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/chunk_cache"),
+            chunk_cache=2**20,
+        )
+        tensor_client.create_tensor(TensorDefinition(path="cached"))
+        tensor_client.store(path="cached", new_data=self.arr)
+        assert tensor_client.read("cached").equals(self.arr)
+        hits = tensor_client.base_map.cache.info()["hits"]
+        assert tensor_client.read("cached").equals(self.arr)
+        assert tensor_client.base_map.cache.info()["hits"] > hits
+
+        tensor_client.append(
+            path="cached", new_data=self.arr2.assign_coords(index=[5, 6, 7, 8, 9])
+        )
+        assert tensor_client.read("cached").sizes["index"] == 10
+
     @pytest.mark.parametrize("use_local", [True, False])
     def test_read_from_formula(self, use_local):
         tensor_client = self.local_tensor_client if use_local else self.tensor_client
@@ -318,8 +681,9 @@ class TestTensorClient:
             path="different_client", name="different_client"
         )
 
+    @pytest.mark.parametrize("scheduler", ["levels", "streaming"])
     @pytest.mark.parametrize("max_parallelization", [1, 2, 4])
-    def test_exec_on_dag_order(self, max_parallelization):
+    def test_exec_on_dag_order(self, max_parallelization, scheduler):
         definitions = [
             TensorDefinition(
                 path="0",
@@ -384,6 +748,7 @@ class TestTensorClient:
         self.tensor_client.exec_on_dag_order(
             method=self.tensor_client.store,
             parallelization_kwargs={"max_parallelization": max_parallelization},
+            scheduler=scheduler,
         )
         assert self.tensor_client.read("0").equals(self.arr)
         assert self.tensor_client.read("1").equals(self.arr * 2)
@@ -395,9 +760,279 @@ class TestTensorClient:
             tensors_path=["1"],
             autofill_dependencies=True,
             parallelization_kwargs={"max_parallelization": max_parallelization},
+            scheduler=scheduler,
         )
         assert self.tensor_client.read("1").equals(self.arr * 2)
 
+    @pytest.mark.parametrize("executor", ["dask", "thread", "process"])
+    def test_exec_on_parallel(self, executor):
+        for path in ["parallel_0", "parallel_1"]:
+            self.tensor_client.create_tensor(TensorDefinition(path=path))
+
+        reports = self.tensor_client.exec_on_parallel(
+            method=self.tensor_client.store,
+            paths_kwargs={
+                "parallel_0": {"new_data": self.arr},
+                "parallel_1": {"new_data": self.arr * 2},
+            },
+            max_parallelization=1,
+            executor=executor,
+        )
+        assert self.tensor_client.read("parallel_0").equals(self.arr)
+        assert self.tensor_client.read("parallel_1").equals(self.arr * 2)
+        assert set(reports) == {"parallel_0", "parallel_1"}
+        assert all(report["duration"] >= 0 for report in reports.values())
+
+        # The errors are reported by path
+        paths_kwargs = {
+            "parallel_0": {"new_data": self.arr},
+            "missing": {"new_data": self.arr},
+        }
+        reports = self.tensor_client.exec_on_parallel(
+            method=self.tensor_client.store,
+            paths_kwargs=paths_kwargs,
+            executor=executor,
+            raise_errors=False,
+        )
+        assert "error" not in reports["parallel_0"]
+        assert "Tensor path: missing" in reports["missing"]["error"].args
+        with pytest.raises(KeyError):
+            self.tensor_client.exec_on_parallel(
+                method=self.tensor_client.store,
+                paths_kwargs=paths_kwargs,
+                executor=executor,
+            )
+
+    def test_exec_on_streaming_dag(self):
+        definitions = [
+            TensorDefinition(path="slow", dag={"depends": [], "group": "first"}),
+            TensorDefinition(path="fast", dag={"depends": [], "group": "first"}),
+            TensorDefinition(path="after_fast", dag={"depends": ["fast"]}),
+            TensorDefinition(path="after_slow", dag={"depends": ["slow"]}),
+        ]
+        events = []
+
+        def method(path):
+            if path == "slow":
+                time.sleep(0.5)
+            if path == "fail":
+                raise ValueError("Failed tensor")
+            events.append(path)
+
+        # The tensors that depend on the fast ones do not wait for the slow ones
+        report = self.tensor_client.exec_on_streaming_dag(method, definitions)
+        assert events.index("after_fast") < events.index("slow")
+        assert report["critical_path"] == ["slow", "after_slow"]
+        assert set(report["timings"]) == {"slow", "fast", "after_fast", "after_slow"}
+
+        # The groups are limited by the max parallelization
+        timings = self.tensor_client.exec_on_streaming_dag(
+            method, definitions, max_parallelization_per_group={"first": 1}
+        )["timings"]
+        first, second = sorted(
+            [timings["slow"], timings["fast"]], key=lambda timing: timing["start"]
+        )
+        assert first["end"] <= second["start"]
+
+        # A limit that does not allow to start any tensor is an error instead of a silent stop
+        events.clear()
+        with pytest.raises(ValueError, match="must be positive"):
+            self.tensor_client.exec_on_streaming_dag(
+                method, definitions, max_parallelization_per_group={"first": 0}
+            )
+        with pytest.raises(ValueError, match="must be positive"):
+            self.tensor_client.exec_on_streaming_dag(
+                method, definitions, max_parallelization=0
+            )
+        assert events == []
+
+        # The dependencies of a failed tensor are not executed
+        events.clear()
+        definitions = [
+            TensorDefinition(path="fail", dag={"depends": []}),
+            TensorDefinition(path="after_fail", dag={"depends": ["fail"]}),
+        ]
+        with pytest.raises(ValueError, match="Failed tensor"):
+            self.tensor_client.exec_on_streaming_dag(method, definitions)
+        assert events == []
+
+    @pytest.mark.parametrize("scheduler", ["levels", "streaming"])
+    def test_resumable_dag_run(self, scheduler):
+        paths = ["a", "b", "c", "d"]
+        for path, depends in [("a", []), ("b", ["a"]), ("c", ["b"]), ("d", ["a"])]:
+            self.tensor_client.create_tensor(
+                TensorDefinition(path=path, dag={"depends": depends})
+            )
+        calls = []
+        failing = {"b"}
+
+        def method(path):
+            calls.append(path)
+            if path in failing:
+                raise ValueError("Failed tensor")
+            self.tensor_client.store(path=path, new_data=self.arr)
+
+        # Only the tensors that depend on the failed one are not executed
+        report = self.tensor_client.exec_on_dag_order(
+            method,
+            tensors_path=paths,
+            run_id="run",
+            continue_on_error=True,
+            scheduler=scheduler,
+        )
+        assert sorted(calls) == ["a", "b", "d"]
+        assert list(report["errors"]) == ["b"]
+        assert report["blocked"] == ["c"]
+        state = self.tensor_client.get_dag_run_state("run")
+        assert {
+            path: record["status"] for path, record in state["tensors"].items()
+        } == {
+            "a": "done",
+            "b": "failed",
+            "d": "done",
+        }
+
+        # The rerun skips the tensors that are done
+        calls.clear()
+        failing.clear()
+        report = self.tensor_client.exec_on_dag_order(
+            method, tensors_path=paths, run_id="run", scheduler=scheduler
+        )
+        assert sorted(calls) == ["b", "c"]
+        assert report["skipped"] == ["a", "d"]
+        assert report["errors"] == {}
+
+        # A modified tensor is executed again with all the tensors that depend on it
+        calls.clear()
+        self.tensor_client.update(path="a", new_data=self.arr * 2)
+        self.tensor_client.exec_on_dag_order(
+            method, tensors_path=paths, run_id="run", scheduler=scheduler
+        )
+        assert sorted(calls) == ["a", "b", "c", "d"]
+
+        # Without the continue_on_error the first error is raised
+        failing.add("a")
+        with pytest.raises(ValueError, match="Failed tensor"):
+            self.tensor_client.exec_on_dag_order(
+                method, tensors_path=paths, scheduler=scheduler
+            )
+
+    @pytest.mark.parametrize("track_data_versions", [True, False])
+    def test_resumable_dag_run_versions(self, tmpdir, track_data_versions):
+        tensor_client = TensorClient(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/versions"),
+            track_data_versions=track_data_versions,
+        )
+        paths = ["a", "b"]
+        for path, depends in [("a", []), ("b", ["a"])]:
+            tensor_client.create_tensor(
+                TensorDefinition(path=path, dag={"depends": depends})
+            )
+        tensor_client.store(path="a", new_data=self.arr)
+        tensor_client.store(path="b", new_data=self.arr)
+        calls = []
+
+        def method(path):
+            calls.append(path)
+
+        if not track_data_versions:
+            # Without the versions of the data it is not possible to know if the tensors were modified
+            with pytest.raises(ValueError, match="track_data_versions"):
+                tensor_client.exec_on_dag_order(
+                    method, tensors_path=paths, run_id="run"
+                )
+            return
+
+        tensor_client.exec_on_dag_order(method, tensors_path=paths, run_id="run")
+        calls.clear()
+        tensor_client.exec_on_dag_order(method, tensors_path=paths, run_id="run")
+        assert calls == []
+
+        calls.clear()
+        tensor_client.update(path="a", new_data=self.arr * 2)
+        tensor_client.exec_on_dag_order(method, tensors_path=paths, run_id="run")
+        assert calls == ["a", "b"]
+
+    @pytest.mark.parametrize("use_dask", [True, False])
+    def test_only_outdated(self, tmpdir, use_dask):
+        tensor_client = TensorClient(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/versions"),
+            track_data_versions=True,
+        )
+        tensor_client.create_tensor(TensorDefinition(path="base"))
+        tensor_client.create_tensor(
+            TensorDefinition(
+                path="derived",
+                definition={
+                    "store": {
+                        "data_transformation": [
+                            {
+                                "method_name": "read_from_formula",
+                                "parameters": {"formula": "`base` * 2"},
+                            }
+                        ]
+                    }
+                },
+                dag={"depends": ["base"]},
+            )
+        )
+        tensor_client.store(path="base", new_data=self.arr)
+
+        def exec_dag():
+            if use_dask:
+                graph = tensor_client.get_dag_for_dask(
+                    "store",
+                    tensors=[tensor_client.get_tensor_definition("derived")],
+                    only_outdated=True,
+                )
+                dask.threaded.get(graph, "WAIT")
+            else:
+                tensor_client.exec_on_dag_order(
+                    "store",
+                    tensors_path=["derived"],
+                    check_dependencies=False,
+                    only_outdated=True,
+                )
+            return tensor_client.get_tensor_definition("derived").metadata
+
+        # The versions of the inputs are recorded on every write
+        assert exec_dag() == {"data_version": 1, "input_versions": {"base": 1}}
+        assert tensor_client.read("derived").equals(self.arr * 2)
+        assert not tensor_client.is_outdated("derived")
+
+        # The tensors are only written again if their dependencies change
+        assert exec_dag()["data_version"] == 1
+        tensor_client.update(path="base", new_data=self.arr * 3)
+        assert tensor_client.is_outdated("derived")
+        assert exec_dag() == {"data_version": 2, "input_versions": {"base": 2}}
+        assert tensor_client.read("derived").equals(self.arr * 6)
+
+    def test_data_version_after_write(self, tmpdir):
+        tensor_client = TensorClient(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/versions"),
+            track_data_versions=True,
+        )
+        tensor_client.create_tensor(TensorDefinition(path="base"))
+
+        # The delayed writes increase the version only when they are computed
+        delayed_write = tensor_client.store(
+            path="base", new_data=self.arr, compute=False
+        )
+        assert (
+            "data_version" not in tensor_client.get_tensor_definition("base").metadata
+        )
+        dask.compute(delayed_write)
+        assert tensor_client.get_tensor_definition("base").metadata["data_version"] == 1
+
+        # The concurrent increases do not lose any version
+        with ThreadPoolExecutor(4) as executor:
+            list(
+                executor.map(
+                    lambda _: tensor_client._increase_data_version("base"), range(8)
+                )
+            )
+        assert tensor_client.get_tensor_definition("base").metadata["data_version"] == 9
+
     @pytest.mark.parametrize(
         "max_per_group, client_type",
         [
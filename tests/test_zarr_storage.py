@@ -1,3 +1,7 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import dask
 import fsspec
 import numpy as np
@@ -238,6 +242,49 @@ class TestZarrStorage:
 
         assert self.storage.read().equals(self.arr)
 
+    @pytest.mark.parametrize("as_dask", [True, False])
+    @pytest.mark.parametrize("index", [[0, 2, 4], [2, 4], [1, 4], [4, 0, 2]])
+    @pytest.mark.parametrize("columns", [[1, 3, 4], [1, 4], [0, 3]])
+    def test_update_chunks(self, tmpdir, as_dask, index, columns):
+        storage = ZarrStorage(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/zarr_update_chunks"),
+            tmp_map=fsspec.get_mapper(tmpdir.strpath + "/tmp/zarr_update_chunks"),
+            data_names="data_test",
+            chunks={"index": 2, "columns": 1},
+            update_mode="chunks",
+        )
+        storage.store(self.arr)
+
+        expected = self.arr.copy()
+        for i, v in enumerate(index):
+            expected.loc[v, columns] = i
+        if as_dask:
+            expected = expected.chunk(index=2, columns=1)
+
+        updates = storage.update_chunks_preview(
+            new_data=expected.sel(index=index, columns=columns).to_dataset(
+                name="data_test"
+            ),
+            fill_value=np.nan,
+            complete_update_dims=None,
+        )
+        # Every region must contain only chunks with modifications
+        for update_data, regions in updates:
+            assert update_data["data_test"].equals(expected.isel(**regions))
+            for dim, chunk, coord in [("index", 2, index), ("columns", 1, columns)]:
+                positions = set(expected.indexes[dim].get_indexer(coord))
+                region_chunks = range(
+                    regions[dim].start // chunk, (regions[dim].stop - 1) // chunk + 1
+                )
+                assert all(
+                    positions & set(range(c * chunk, (c + 1) * chunk))
+                    for c in region_chunks
+                )
+
+        delayed_writes = storage.update(expected.sel(index=index, columns=columns))
+        assert len(delayed_writes) == len(updates)
+        assert storage.read().equals(expected)
+
     @pytest.mark.parametrize("keep_order", [True, False])
     def test_store_dataset(self, keep_order: bool):
         storage_dataset = (
@@ -292,6 +339,385 @@ class TestZarrStorage:
         self.storage.drop(coords)
         assert self.storage.read().equals(self.arr.drop_sel(coords))
 
+    @pytest.mark.parametrize(
+        "coords, rewrite",
+        [
+            ({"index": [3, 4]}, False),
+            ({"index": [4], "columns": [3, 4]}, False),
+            ({"index": [1, 3], "columns": [2]}, False),
+            ({"index": [0], "columns": [0]}, True),
+        ],
+    )
+    def test_drop_in_place(self, monkeypatch, coords, rewrite):
+        storage = self.storage
+        storage.max_rewrite_chunks = 2
+        storage.store(self.arr)
+
+        store = storage.store
+        rewrite_calls = []
+
+        def count_store(*args, **kwargs):
+            rewrite_calls.append(kwargs.get("rewrite", False))
+            return store(*args, **kwargs)
+
+        monkeypatch.setattr(storage, "store", count_store)
+        delayed_writes = storage.drop(coords)
+        assert rewrite_calls == ([True] if rewrite else [])
+        assert isinstance(delayed_writes, list) != rewrite
+        expected = self.arr.drop_sel(coords)
+        assert storage.read().equals(expected)
+
+        # The tensor must keep working after the drop
+        storage.append(self.arr2)
+        assert (
+            storage.read()
+            .sortby(["index", "columns"])
+            .equals(expected.combine_first(self.arr2))
+        )
+
+    def test_drop_missing_coords(self):
+        self.storage.max_rewrite_chunks = 2
+        self.storage.store(self.arr)
+        with pytest.raises(KeyError):
+            self.storage.drop({"index": [10]})
+        with pytest.raises(KeyError):
+            self.storage.drop({"index": [4, 10]})
+        assert self.storage.read().equals(self.arr)
+
+    def test_drop_in_place_failure(self, monkeypatch):
+        storage = self.storage
+        storage.max_rewrite_chunks = 2
+        storage.store(self.arr)
+        coords = {"index": [1, 3], "columns": [2]}
+
+        # The original cells and size are restored if the shifted tail can not be written
+        resize = storage._resize
+
+        def failing_resize(data_map, dim, size):
+            monkeypatch.setattr(storage, "_resize", resize)
+            raise OSError("Failed resize")
+
+        monkeypatch.setattr(storage, "_resize", failing_resize)
+        with pytest.raises(OSError, match="Failed resize"):
+            storage.drop(coords)
+        assert storage.read().equals(self.arr)
+
+        # The delayed drop uses the rewrite
+        dask.compute(storage.drop(coords, compute=False))
+        assert storage.read().equals(self.arr.drop_sel(coords))
+
+    def test_cache_dataset(self, tmpdir, monkeypatch):
+        storage = ZarrStorage(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/zarr_cached"),
+            tmp_map=fsspec.get_mapper(tmpdir.strpath + "/tmp/zarr_cached"),
+            data_names="data_test",
+            chunks={"index": 3, "columns": 2},
+            cache_dataset=True,
+        )
+        storage.store(self.arr)
+
+        open_zarr = xr.open_zarr
+        calls = []
+
+        def count_open_zarr(*args, **kwargs):
+            calls.append(1)
+            return open_zarr(*args, **kwargs)
+
+        monkeypatch.setattr(xr, "open_zarr", count_open_zarr)
+
+        new_data = xr.concat([self.arr + 1, self.arr3], dim="index")
+        storage.upsert(new_data)
+        assert len(calls) == 1
+        assert storage.read().equals(new_data)
+        assert len(calls) == 2
+
+        # A write made by another storage must be detected using the metadata
+        other_storage = ZarrStorage(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/zarr_cached"),
+            tmp_map=fsspec.get_mapper(tmpdir.strpath + "/tmp/zarr_cached"),
+            data_names="data_test",
+        )
+        other_storage.store(self.arr2)
+        assert storage.read().equals(self.arr2)
+
+    def test_versioned(self, tmpdir):
+        base_map = fsspec.get_mapper(tmpdir.strpath + "/zarr_versioned")
+        tmp_map = fsspec.get_mapper(tmpdir.strpath + "/tmp/zarr_versioned")
+        flat_storage = ZarrStorage(
+            base_map=base_map,
+            tmp_map=tmp_map,
+            data_names="data_test",
+            chunks={"index": 3, "columns": 2},
+        )
+        flat_storage.store(self.arr)
+
+        storage = ZarrStorage(
+            base_map=base_map,
+            tmp_map=tmp_map,
+            data_names="data_test",
+            chunks={"index": 3, "columns": 2},
+            sorted_coords={"index": True},
+            max_rewrite_chunks=0,
+            versioned=True,
+            keep_versions=2,
+        )
+        # The data stored without versions must be readable and deleted by the first version
+        assert storage.read().equals(self.arr)
+        storage.store(self.arr + 1)
+        assert storage.read().equals(self.arr + 1)
+        assert not any(
+            key.startswith(".z") for key in base_map if key != storage.version_key
+        )
+
+        # The insertion in the middle rewrites the tensor without using the tmp map
+        old_data = storage.read()
+        storage.append(self.arr2.assign_coords(index=[-3, -2, -1]) + 1)
+        assert len(tmp_map) == 0
+        expected = (self.arr + 1).combine_first(
+            self.arr2.assign_coords(index=[-3, -2, -1]) + 1
+        )
+        assert storage.read().equals(expected)
+        # The previous version is kept for the readers that opened it
+        assert old_data.equals(self.arr + 1)
+
+        storage.update(expected.isel(index=[0]) * 10)
+        expected[0] = expected[0] * 10
+        assert storage.read().equals(expected)
+
+        delayed_write = storage.store(self.arr, compute=False)
+        assert storage.read().equals(expected)
+        dask.compute(delayed_write)
+        assert storage.read().equals(self.arr)
+        assert storage._read_pointer()["versions"] == [1, 2]
+        assert sorted(
+            {
+                key.split("/")[1]
+                for key in base_map
+                if "/" in key and key != storage.version_counter_key
+            }
+        ) == ["1", "2"]
+        assert storage.exist()
+
+        storage.delete_tensor()
+        assert not storage.exist()
+
+    def test_versioned_concurrent_writes(self, tmpdir, monkeypatch):
+        storage = ZarrStorage(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/zarr_versioned"),
+            tmp_map=fsspec.get_mapper(tmpdir.strpath + "/tmp/zarr_versioned"),
+            data_names="data_test",
+            chunks={"index": 3, "columns": 2},
+            versioned=True,
+            keep_versions=8,
+        )
+        storage.store(self.arr)
+
+        # The versions are reserved when the write starts, so a delayed write can not be
+        # overwritten by the writes made before computing it
+        delayed_write = storage.store(self.arr + 1, compute=False)
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(lambda i: storage.store(self.arr + i), range(2, 6)))
+        dask.compute(delayed_write)
+        assert storage.read().equals(self.arr + 1)
+        versions = storage._read_pointer()["versions"]
+        assert sorted(versions) == list(range(6))
+        for version in versions:
+            data = xr.open_zarr(
+                storage._layer_map(version).as_zarr_store(), consolidated=True
+            )["data_test"]
+            assert (data - self.arr).std().compute().item() == 0
+
+        # An incomplete pointer is read again until it is complete
+        base_map = storage.base_map
+        pointer = base_map[storage.version_key]
+        base_map[storage.version_key] = pointer[:5]
+        sleep = time.sleep
+
+        def complete_pointer(seconds):
+            storage.base_map[storage.version_key] = pointer
+            sleep(seconds)
+
+        monkeypatch.setattr(time, "sleep", complete_pointer)
+        assert storage.read().equals(self.arr + 1)
+
+        base_map[storage.version_key] = pointer[:5]
+        monkeypatch.setattr(time, "sleep", lambda seconds: None)
+        with pytest.raises(ValueError, match="can not be read"):
+            storage.read()
+
+    def test_snapshots(self, tmpdir):
+        storage = ZarrStorage(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/zarr_snapshots"),
+            tmp_map=fsspec.get_mapper(tmpdir.strpath + "/tmp/zarr_snapshots"),
+            data_names="data_test",
+            chunks={"index": 3, "columns": 2},
+            versioned=True,
+            keep_versions=1,
+        )
+        with pytest.raises(ValueError):
+            storage.snapshot()
+
+        storage.store(self.arr)
+        assert storage.snapshot("first") == "first"
+        manifest = storage.get_snapshot_manifest("first")
+        assert ".zmetadata" in manifest and "data_test/0.0" in manifest
+
+        # The writes after the snapshot must not modify it
+        storage.append(self.arr2)
+        storage.update(self.arr.isel(index=[0]) * 10)
+        storage.drop({"columns": [6]})
+        expected = self.arr.combine_first(self.arr2).drop_sel(columns=[6])
+        expected[0] = expected[0] * 10
+        assert storage.read().equals(expected)
+        assert storage.read(version="first").equals(self.arr)
+
+        storage.snapshot("second")
+        storage.store(self.arr + 1)
+        assert storage.read().equals(self.arr + 1)
+        assert storage.read(version="first").equals(self.arr)
+        assert storage.read(version="second").equals(expected)
+
+        storage.restore_snapshot("first")
+        assert storage.read().equals(self.arr)
+        storage.append(self.arr2)
+        assert storage.read().equals(self.arr.combine_first(self.arr2))
+        assert storage.read(version="first").equals(self.arr)
+
+        storage.delete_snapshot("first")
+        assert storage.get_snapshots() == {"second": storage.get_snapshots()["second"]}
+        with pytest.raises(KeyError):
+            storage.read(version="first")
+        assert storage.read(version="second").equals(expected)
+        assert storage.read().equals(self.arr.combine_first(self.arr2))
+
+    def test_snapshots_max_layers(self, tmpdir):
+        storage = ZarrStorage(
+            base_map=fsspec.get_mapper(tmpdir.strpath + "/zarr_snapshots_layers"),
+            tmp_map=fsspec.get_mapper(tmpdir.strpath + "/tmp/zarr_snapshots_layers"),
+            data_names="data_test",
+            chunks={"index": 3, "columns": 2},
+            versioned=True,
+            keep_versions=1,
+            max_layers=2,
+        )
+        storage.store(self.arr)
+        storage.snapshot("first")
+        storage.drop({"columns": [1]})
+        expected = self.arr.drop_sel(columns=[1])
+        for i in range(4):
+            storage.snapshot(f"snapshot_{i}")
+            storage.update(expected.isel(index=[0]) * 2)
+            expected = expected.copy()
+            expected[0] = expected[0] * 2
+            pointer = storage._read_pointer()
+            assert len(storage._layer_chain(pointer["version"], pointer)) <= 2
+            assert storage.read().equals(expected)
+
+        assert storage.read(version="first").equals(self.arr)
+        assert storage.read(version="snapshot_0").equals(self.arr.drop_sel(columns=[1]))
+        manifest = storage.get_snapshot_manifest("snapshot_1")
+        # The chunks deleted by the drop must not be taken from the older layers
+        assert manifest.keys() == storage.get_snapshot_manifest("snapshot_2").keys()
+        data_map = storage._data_map(storage.get_snapshots()["snapshot_1"], pointer)
+        assert (
+            manifest["data_test/0.0"]
+            == hashlib.md5(data_map["data_test/0.0"]).hexdigest()
+        )
+
+    def test_append_log(self, tmpdir):
+        def get_storage(name, **kwargs):
+            return ZarrStorage(
+                base_map=fsspec.get_mapper(f"{tmpdir.strpath}/{name}"),
+                tmp_map=fsspec.get_mapper(f"{tmpdir.strpath}/tmp/{name}"),
+                data_names="data_test",
+                chunks={"index": 3, "columns": 2},
+                sorted_coords={"index": True},
+                **kwargs,
+            )
+
+        storage = get_storage("zarr_append_log", append_log=True, max_append_log=3)
+        expected_storage = get_storage("zarr_expected")
+        storage.store(self.arr)
+        expected_storage.store(self.arr)
+
+        new_data = [
+            self.arr.isel(index=[-1]).assign_coords(index=[5]) * 2,
+            self.arr2.isel(index=[0, 1], columns=[0, 1]).assign_coords(
+                index=[6, 7], columns=[0, 7]
+            ),
+            # Insertion at the beginning of the sorted index
+            self.arr.isel(index=[0], columns=[0]).assign_coords(index=[-1]),
+        ]
+        for data in new_data[:2]:
+            assert storage.append(data) == []
+            expected_storage.append(data)
+        assert len(storage._append_log_keys()) == 2
+        assert storage._read_stored().equals(self.arr)
+        assert storage.read().equals(expected_storage.read())
+
+        # The max_append_log compacts the log automatically
+        storage.append(new_data[2])
+        expected_storage.append(new_data[2])
+        assert len(storage._append_log_keys()) == 0
+        assert storage._read_stored().equals(expected_storage.read())
+
+        storage.append(new_data[0].assign_coords(index=[8]))
+        expected_storage.append(new_data[0].assign_coords(index=[8]))
+        assert storage.read().equals(expected_storage.read())
+        # The log is compacted before any update
+        storage.update(self.arr.isel(index=[0]) * 10)
+        expected_storage.update(self.arr.isel(index=[0]) * 10)
+        assert len(storage._append_log_keys()) == 0
+        assert storage.read().equals(expected_storage.read())
+
+        # Applying again the same deltas has no effect
+        storage.append(new_data[1])
+        keys = storage._append_log_keys()
+        storage.compact()
+        storage._append_log_map()[keys[0]] = storage._encode_delta(
+            storage._transform_to_dataset(new_data[1] * 3, chunk_data=False), np.nan
+        )
+        assert storage.read().equals(expected_storage.read())
+
+        # The log is discarded when the tensor is stored again
+        storage.store(self.arr)
+        assert storage._append_log_keys() == []
+        assert storage.read().equals(self.arr)
+
+    def test_compact_out_of_order(self, tmpdir, monkeypatch):
+        storage = ZarrStorage(
+            base_map=fsspec.get_mapper(f"{tmpdir.strpath}/zarr_compact"),
+            tmp_map=fsspec.get_mapper(f"{tmpdir.strpath}/tmp/zarr_compact"),
+            data_names="data_test",
+            chunks={"index": 3, "columns": 2},
+            sorted_coords={"index": True},
+            append_log=True,
+            max_append_log=0,
+        )
+        storage.store(self.arr.isel(index=[1, 2, 3, 4]))
+        # Both deltas are inserted at the beginning of the sorted index
+        storage.append(self.arr.isel(index=[0]))
+        storage.append(self.arr.isel(index=[0]).assign_coords(index=[-1]) * 2)
+        expected = storage.read().compute()
+        keys = storage._append_log_keys()
+
+        # A failure after the rewrite must keep all the deltas on the log
+        def fail_delete(keys):
+            raise OSError("Failed delete")
+
+        monkeypatch.setattr(storage, "_delete_append_log", fail_delete)
+        with pytest.raises(OSError, match="Failed delete"):
+            storage.compact()
+        monkeypatch.undo()
+        assert storage._append_log_keys() == keys
+        assert storage._read_stored().equals(expected)
+        assert storage.read().equals(expected)
+
+        # Applying the deltas again has no effect
+        storage.compact()
+        assert storage._append_log_keys() == []
+        assert storage.read().equals(expected)
+
     def test_keep_sorted(self):
         arr = self.arr.chunk(index=3, columns=2)
         new_data = arr.sel(index=[3, 2, 0, 4, 1], columns=[3, 4, 2, 0, 1])
@@ -346,6 +772,74 @@ class TestZarrStorage:
         )
         assert storage.read().equals(expected_representation)
 
+    @pytest.mark.parametrize("max_rewrite_chunks", [0, 1, 4])
+    def test_insert_in_the_middle_partial_rewrite(
+        self, monkeypatch, max_rewrite_chunks
+    ):
+        storage = self.storage_sorted_unique
+        storage.max_rewrite_chunks = max_rewrite_chunks
+        arr = xr.DataArray(
+            np.random.rand(10, 4),
+            dims=["index", "columns"],
+            coords={"index": list(range(20, 0, -2)), "columns": [8, 6, 4, 2]},
+        )
+        storage.store(arr)
+
+        # Insert a row in the middle of the index and a column at the end
+        append_arr = xr.DataArray(
+            [[100.0, 200.0]],
+            dims=arr.dims,
+            coords={"index": [5], "columns": [4, 1]},
+        )
+        store = storage.store
+        rewrite_calls = []
+
+        def count_store(*args, **kwargs):
+            rewrite_calls.append(kwargs.get("rewrite", False))
+            return store(*args, **kwargs)
+
+        monkeypatch.setattr(storage, "store", count_store)
+        storage.append(append_arr)
+
+        # Only the last two chunks of the index must be rewritten
+        assert rewrite_calls == ([True] if max_rewrite_chunks < 2 else [])
+        expected = arr.combine_first(append_arr)[::-1, ::-1]
+        assert storage.read().equals(expected)
+        assert storage.read().chunksizes == {
+            "index": (3, 3, 3, 2),
+            "columns": (2, 2, 1),
+        }
+
+    def test_insert_in_the_middle_failure(self, monkeypatch):
+        storage = self.storage_sorted_unique
+        storage.max_rewrite_chunks = 4
+        arr = xr.DataArray(
+            np.random.rand(10, 4),
+            dims=["index", "columns"],
+            coords={"index": list(range(20, 0, -2)), "columns": [8, 6, 4, 2]},
+        )
+        storage.store(arr)
+        append_arr = xr.DataArray(
+            [[100.0]], dims=arr.dims, coords={"index": [5], "columns": [4]}
+        )
+
+        # The original cells and size are restored if the shifted tail can not be written
+        write_region = storage._write_region
+
+        def failing_write_region(*args, **kwargs):
+            monkeypatch.setattr(storage, "_write_region", write_region)
+            raise OSError("Failed write")
+
+        monkeypatch.setattr(storage, "_write_region", failing_write_region)
+        with pytest.raises(OSError, match="Failed write"):
+            storage.append(append_arr)
+        assert storage.read().equals(arr)
+
+        # The delayed writes use the rewrite
+        delayed_writes = storage.append(append_arr, compute=False)
+        dask.compute(delayed_writes)
+        assert storage.read().equals(arr.combine_first(append_arr)[::-1, ::-1])
+
     def test_preview_append(self):
         storage = self.storage_sorted_unique
         arr = xr.DataArray(
@@ -392,6 +886,43 @@ class TestZarrStorage:
         assert data_to_append["index"]["data_test"].equals(expected[2:, :2])
         assert data_to_append["columns"]["data_test"].equals(expected[:, 2:])
 
+    def test_append_without_concat(self, monkeypatch):
+        storage = self.storage
+        arr = xr.DataArray(
+            np.random.rand(7, 5),
+            dims=["index", "columns"],
+            coords={"index": list(range(7)), "columns": list(range(5))},
+        )
+        act_arr = arr.isel(index=slice(0, 4), columns=slice(0, 3))
+        storage.store(act_arr)
+        append_arr = arr.isel(index=slice(4, None))
+        expected = storage.append_preview(
+            append_arr.to_dataset(name="data_test"), np.nan
+        )
+
+        def fail_concat(*args, **kwargs):
+            raise AssertionError("The append must not concat the stored data")
+
+        monkeypatch.setattr(xr, "concat", fail_concat)
+        _, data_to_append, rewrite = storage._plan_append(
+            append_arr.to_dataset(name="data_test"), np.nan
+        )
+        assert not rewrite
+        assert {dim: data.chunksizes for dim, data in data_to_append.items()} == {
+            dim: data.chunksizes for dim, data in expected[1].items()
+        }
+        assert data_to_append["index"].chunksizes == {
+            "index": (2, 1),
+            "columns": (2, 1),
+        }
+        assert data_to_append["columns"].chunksizes == {
+            "index": (3, 3, 1),
+            "columns": (1, 1),
+        }
+
+        storage.append(append_arr)
+        assert storage.read().equals(act_arr.combine_first(append_arr))
+
 
 if __name__ == "__main__":
     test = TestZarrStorage()